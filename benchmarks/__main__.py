@@ -0,0 +1,32 @@
+
+import argparse
+import sys
+
+from benchmarks import bench_context, bench_editors, bench_inventory, bench_templates
+from benchmarks.harness import Runner
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description="possible engine benchmarks")
+    parser.add_argument('--quick', dest='quick', action="store_true", help="ten times fewer iterations, skip largest inventory")
+    parser.add_argument('--sshd', dest='sshd', action="store", type=int, metavar="PORT", help="also run context benchmarks via ssh to sshd on localhost:PORT")
+    parser.add_argument('--output', dest='output', action="store", metavar="FILE", help="append results to FILE")
+    parser.add_argument('only', nargs='*', metavar="PREFIX", help="run only benchmarks which names start with PREFIX")
+    return parser.parse_args()
+
+
+def main():
+    sys.dont_write_bytecode = True
+    args = parse_args()
+    runner = Runner(quick=args.quick, only=args.only, output=args.output)
+    runner.header()
+    bench_context.run(runner)
+    if args.sshd is not None:
+        bench_context.run(runner, sshd_port=args.sshd)
+    bench_editors.run(runner)
+    bench_templates.run(runner)
+    bench_inventory.run(runner)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+
+__all__ = ['run']
+
+from possible.context import Context
+from possible.editors import replace_line
+
+from benchmarks.sandbox import Sandbox
+
+
+def run(runner, *, sshd_port=None):
+    """Context operations against sandbox, converged and changing."""
+    prefix = 'context.sshd' if sshd_port is not None else 'context'
+    with Sandbox(sshd_port=sshd_port) as sandbox:
+        c = Context(sandbox.hostnames[0])
+        small = sandbox.remote('small.conf')
+        large = sandbox.remote('large.conf')
+        small_content = 'key = value\n' * 10
+        large_content = ''.join(f"key{index} = value{index}\n" for index in range(100000))
+        (sandbox.workdir / 'files' / 'small.conf').write_text(small_content)
+        c.put(small_content, small)
+        c.put(large_content, large)
+        counter = iter(range(1000000))
+
+        runner.measure(f"{prefix}.run", lambda: c.run('true'), number=100)
+        runner.measure(f"{prefix}.run.output.large.unused", lambda: c.run(f"cat {large}"), number=20)
+        runner.measure(f"{prefix}.run.output.large.lines", lambda: sum(1 for line in c.run(f"cat {large}").iter_lines()), number=20)
+        runner.measure(f"{prefix}.put.converged", lambda: c.put(small_content, small), number=100)
+        runner.measure(f"{prefix}.put.changed", lambda: c.put(f"{small_content}{next(counter)}\n", small), number=100)
+        runner.measure(f"{prefix}.put.large.converged", lambda: c.put(large_content, large), number=20)
+        runner.measure(f"{prefix}.get", lambda: c.get(small), number=100)
+        runner.measure(f"{prefix}.get.large", lambda: c.get(large), number=20)
+        runner.measure(f"{prefix}.copy.converged", lambda: c.copy('small.conf', small), number=100)
+        runner.measure(f"{prefix}.edit.converged", lambda: c.edit(small, replace_line('key = .*', 'key = value')), number=100)
+        runner.measure(f"{prefix}.edit.changed", lambda: c.edit(small, replace_line('key = .*', f"key = {next(counter)}")), number=100)
+        runner.measure(f"{prefix}.chmod.converged", lambda: c.chmod(small, mode='0644'), number=100)
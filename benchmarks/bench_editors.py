@@ -0,0 +1,21 @@
+
+__all__ = ['run']
+
+from possible.editors import _apply_editors, append_line, delete_line, edit_ini_section, insert_line, replace_line, substitute_line, strip_line
+
+
+def run(runner):
+    """Editor chains on large texts."""
+    text = ''.join(f"key{index} = value{index}\n" for index in range(100000))
+    ini = ''.join(f"[section{section}]\n" + ''.join(f"key{index} = value{index}\n" for index in range(100)) for section in range(1000))
+    chain = (
+        replace_line('key1 = .*', 'key1 = changed'),
+        substitute_line('value2$', 'changed'),
+        delete_line('key3 = .*'),
+        insert_line('inserted = 1', after='key4 = .*'),
+        append_line('appended = 1'),
+        strip_line(),
+    )
+    runner.measure("editors.replace_line.100k", lambda: _apply_editors(text, replace_line('key1 = .*', 'key1 = changed')), number=20)
+    runner.measure("editors.chain6.100k", lambda: _apply_editors(text, *chain), number=10)
+    runner.measure("editors.edit_ini_section.100k", lambda: _apply_editors(ini, edit_ini_section('[section500]', replace_line('key1 = .*', 'key1 = changed'))), number=10)
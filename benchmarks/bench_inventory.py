@@ -0,0 +1,26 @@
+
+__all__ = ['run']
+
+import shutil
+import tempfile
+from pathlib import Path
+
+from possible.engine.config import Config
+from possible.engine.inventory import Inventory
+
+from benchmarks.sandbox import write_inventory, sandbox_args
+
+
+def run(runner):
+    """Inventory parsing of hosts, groups and vars files."""
+    for hosts in (10, 1000, 50000):
+        if runner.quick and hosts > 1000:
+            continue
+        directory = Path(tempfile.mkdtemp(prefix='possible-bench-'))
+        try:
+            write_inventory(directory, hosts)
+            config = Config(sandbox_args())
+            config.workdir = directory
+            runner.measure(f"inventory.parse.{hosts}", lambda: Inventory(config), number=max(1, 10000 // hosts) if hosts > 10 else 100)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,25 @@
+
+__all__ = ['run']
+
+from possible.templates import render, render_template
+
+from benchmarks.sandbox import Sandbox
+
+
+TEMPLATE = """\
+# generated
+{% for item in items %}
+server {{ item.name }} {{ item.address }}:{{ item.port }}{% if item.backup %} backup{% endif %}
+
+{% endfor %}
+"""
+
+
+def run(runner):
+    """Template rendering from string and from files directory."""
+    items = [{'name': f"server{index}", 'address': f"10.0.{index // 256}.{index % 256}", 'port': 8080, 'backup': index % 10 == 0} for index in range(10000)]
+    runner.measure("templates.render.small", lambda: render("key = {{ value }}\n", value=1), number=1000)
+    runner.measure("templates.render.10k", lambda: render(TEMPLATE, items=items), number=20)
+    with Sandbox() as sandbox:
+        (sandbox.workdir / 'files' / 'servers.conf.j2').write_text(TEMPLATE)
+        runner.measure("templates.render_template.10k", lambda: render_template('servers.conf.j2', items=items), number=20)
@@ -0,0 +1,50 @@
+
+__all__ = ['Runner']
+
+import gc
+import statistics
+import time
+
+
+class Runner:
+    """Collects timings of benchmarks and prints them as table."""
+    def __init__(self, *, quick=False, only=None, output=None):
+        self.quick = quick
+        self.only = only
+        self.output = output
+        self.results = list()
+
+    def enabled(self, name):
+        return not self.only or any(name.startswith(prefix) for prefix in self.only)
+
+    def measure(self, name, func, *, number, setup=None):
+        """Call ``func()`` ``number`` times, after optional ``setup()`` before each call, and record timings."""
+        if not self.enabled(name):
+            return
+        if self.quick:
+            number = max(1, number // 10)
+        timings = list()
+        gc.collect()
+        for dummy_index in range(number):
+            if setup is not None:
+                setup()
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        result = (name, number, statistics.mean(timings), min(timings), max(timings))
+        self.results.append(result)
+        self.print_line(self.format(result))
+
+    @staticmethod
+    def format(result):
+        name, number, mean, minimum, maximum = result
+        return f"{name:44} {number:>6} {mean * 1000:>12.3f} {minimum * 1000:>12.3f} {maximum * 1000:>12.3f}"
+
+    def header(self):
+        self.print_line(f"{'benchmark':44} {'calls':>6} {'mean, ms':>12} {'min, ms':>12} {'max, ms':>12}")
+
+    def print_line(self, line):
+        print(line, flush=True)
+        if self.output is not None:
+            with open(self.output, 'a') as output_file:
+                output_file.write(line + '\n')
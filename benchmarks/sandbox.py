@@ -0,0 +1,94 @@
+
+__all__ = ['Sandbox', 'sandbox_args', 'write_inventory']
+
+import getpass
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from possible.engine import runtime
+from possible.engine.cli import parse_args
+from possible.engine.config import Config
+from possible.engine.events import events, HumanRenderer
+from possible.engine.inventory import Inventory
+
+
+def sandbox_args():
+    """Command line arguments of ``pos``, as parsed for sandbox run, so defaults are the same as of real run."""
+    return parse_args(['--quiet'])
+
+
+def write_inventory(workdir, hosts, *, host_config=None, hosts_per_group=100, vars_per_group=10):
+    """Write inventory with ``hosts`` hosts, groups of ``hosts_per_group`` hosts and vars for each group."""
+    inventory = workdir / 'inventory'
+    inventory.mkdir(parents=True, exist_ok=True)
+    host_lines = list()
+    group_lines = list()
+    vars_lines = list()
+    for index in range(hosts):
+        name = f"host{index:06d}"
+        host_lines.append(f"- {name}:")
+        for key, value in (host_config or {'host': f"{name}.example.com"}).items():
+            host_lines.append(f"    {key}: {value}")
+        if index % hosts_per_group == 0:
+            group = f"group{index // hosts_per_group:04d}"
+            group_lines.append(f"- {group}:")
+            vars_lines.append(f"- {group}:")
+            for var_index in range(vars_per_group):
+                vars_lines.append(f"    var{var_index}: value{var_index}")
+        group_lines.append(f"    - {name}")
+    (inventory / 'hosts.yaml').write_text('\n'.join(host_lines) + '\n')
+    if hosts > 1:
+        (inventory / 'groups.yaml').write_text('\n'.join(group_lines) + '\n')
+        (inventory / 'vars.yaml').write_text('\n'.join(vars_lines) + '\n')
+
+
+class Sandbox:
+    """Temporary workdir with inventory and ``files`` directory, and remote root directory.
+
+    Sets ``runtime.config`` and ``runtime.inventory`` like ``pos`` does.
+    By default hosts use ``connection: local``, with ``sshd_port`` they use real ssh to sshd on localhost, as current user.
+    Remote file names used by benchmarks point inside sandbox root directory, so no files outside of it are touched.
+    """
+    def __init__(self, *, hosts=1, sshd_port=None):
+        self.hosts = hosts
+        self.sshd_port = sshd_port
+        self.directory = None
+        self.workdir = None
+        self.root = None
+        self.saved = None
+
+    def __enter__(self):
+        self.directory = Path(tempfile.mkdtemp(prefix='possible-bench-'))
+        self.workdir = self.directory / 'work'
+        self.root = self.directory / 'root'
+        self.root.mkdir()
+        (self.workdir / 'files').mkdir(parents=True)
+        if self.sshd_port is None:
+            host_config = {'connection': 'local'}
+        else:
+            host_config = {'host': 'localhost', 'port': self.sshd_port, 'user': getpass.getuser()}
+        write_inventory(self.workdir, self.hosts, host_config=host_config)
+        config = Config(sandbox_args())
+        config.workdir = self.workdir
+        self.saved = (runtime.config, runtime.inventory, events.renderer)
+        runtime.config = config
+        runtime.inventory = Inventory(config)
+        runtime.caches.clear()
+        events.renderer = HumanRenderer(quiet=True)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        runtime.config, runtime.inventory, events.renderer = self.saved
+        runtime.caches.clear()
+        runtime.current.contexts.clear()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    @property
+    def hostnames(self):
+        return sorted(runtime.inventory.hosts)
+
+    def remote(self, *parts):
+        """Absolute remote file name inside sandbox root directory."""
+        return os.path.join(str(self.root), *parts)
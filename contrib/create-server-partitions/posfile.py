@@ -208,7 +208,7 @@ class PartMan:
         return " ".join(out)
 
     def is_live_cd(self):
-        out = self.c.run("mount").stdout
+        out = self.c.run("mount", changes=False).stdout
         lines = out.split("\n")
         for line in lines:
             if line.startswith("overlay on / type overlay"):
@@ -218,7 +218,7 @@ class PartMan:
         return False
 
     def is_devices_has_no_partitions(self):
-        stdout = self.c.run("lsblk --noheadings --output NAME,TYPE --raw").stdout
+        stdout = self.c.run("lsblk --noheadings --output NAME,TYPE --raw", changes=False).stdout
         devices = set()
         for line in stdout.split('\n'):
             line = line.strip()
@@ -238,7 +238,7 @@ class PartMan:
         if not self.is_live_cd():
             raise RuntimeError("Not in LiveCD mode")
         print()
-        print(self.c.run('lsblk').stdout)
+        print(self.c.run('lsblk', changes=False).stdout)
         print()
         if self.is_devices_has_no_partitions():
             print(f"Devices {self.devices} has no partitions.")
@@ -249,7 +249,7 @@ class PartMan:
         if not self.is_devices_has_no_partitions():
             print(f"Devices {self.devices} already has partitions:")
             print()
-            print(self.c.run('lsblk').stdout)
+            print(self.c.run('lsblk', changes=False).stdout)
             print()
             print("Nothing to do.")
             sys.exit(1)
@@ -280,7 +280,7 @@ class PartMan:
         self.c.run(f"lvcreate -n  tmp -L {self.tmp_size_in_gib}G centos")
         self.c.run(f"lvcreate -n  var -L {self.var_size_in_gib}G centos")
         print()
-        print(self.c.run('lsblk').stdout)
+        print(self.c.run('lsblk', changes=False).stdout)
         print()
         print("Done.")
 
@@ -288,7 +288,7 @@ class PartMan:
         if not self.is_live_cd():
             raise RuntimeError("Not in LiveCD mode")
         print()
-        print(self.c.run('lsblk').stdout)
+        print(self.c.run('lsblk', changes=False).stdout)
         print()
         if self.is_devices_has_no_partitions():
             print(f"Devices {self.devices} has no partitions.")
@@ -314,7 +314,7 @@ class PartMan:
             self.c.run(f"parted -s /dev/{device} -- rm 4", can_fail=True)
 
         print()
-        print(self.c.run('lsblk').stdout)
+        print(self.c.run('lsblk', changes=False).stdout)
         print()
         print("Done.")
 
@@ -1,210 +1,791 @@
 
-__all__ = ['Context', 'local_run']
-
+__all__ = ['Context', 'local_run', 'reboot_hosts']
+
+import base64
+import concurrent.futures
+import contextlib
+import difflib
+import functools
+import hashlib
+import io
 import os
+import re
+import socket
 import sys
-import subprocess
+import tarfile
+import threading
 import time
-import tempfile
+import uuid
 
 from possible.engine import runtime
-from possible.editors import _apply_editors, edit, append_line, replace_line, strip
-from possible.engine.exceptions import PossibleRuntimeError, PossibleFileNotFound
+from possible.editors import _apply_editors, replace_line, strip
+from possible.packages import Packages, PACKAGE_COMMANDS
+from possible.systemd import Systemd
+from possible.engine.events import events
+from possible.engine.exceptions import PossibleRuntimeError, PossibleFileNotFound, PossibleHostUnreachable, PossibleTimeout
+from possible.engine.health import health
+from possible.engine.process import communicate, start_process, timeouts
+from possible.engine.report import report
 from possible.engine.utils import to_bytes, to_text
-from possible.engine.transport import SSH
+from possible.engine.transport import connect
+
+
+STREAM_MAX_OUTPUT = 1024 * 1024
+
+ITER_LINES_CHUNK_SIZE = 1024 * 1024
+
+REBOOT_POLL_MIN_DELAY = 0.5
+
+REBOOT_POLL_MAX_DELAY = 8
+
+ACCOUNT_DATABASES = ('passwd', 'group')
+
+ACCOUNT_COMMANDS = re.compile(r'\b(useradd|usermod|userdel|groupadd|groupmod|groupdel|gpasswd)\b')
+
+LOCAL_LOG_NAME = 'local'
 
+LOG_LOCKS = dict()
 
-LOCAL_COMMAND_TIMEOUT = 600
+LOG_LOCKS_LOCK = threading.Lock()
 
 
-def local_run(command, *, stdin=None, can_fail=False):
-    old_cwd = os.getcwd()
-    os.chdir(runtime.config.files)
+def _log_lock(name):
+    with LOG_LOCKS_LOCK:
+        if name not in LOG_LOCKS:
+            LOG_LOCKS[name] = threading.Lock()
+        return LOG_LOCKS[name]
+
+
+@contextlib.contextmanager
+def _line_handler(name, command, on_line):
+    """Callback ``on_bytes_line(stream, line)`` for :func:`communicate`, or None without ``on_line``.
+
+    Each line is decoded, stripped of ``\\r`` and passed to ``on_line(line, stream)``.
+    With ``--log-dir`` command and its lines are also appended to ``NAME.log`` file in it,
+    writes to one file are serialized, so lines written by parallel threads never mix.
+    """
+    if on_line is None:
+        yield None
+        return
+    lock = _log_lock(name)
+    log_file = None
+    if runtime.config.log_dir is not None:
+        runtime.config.log_dir.mkdir(parents=True, exist_ok=True)
+        log_file = open(runtime.config.log_dir / f"{name}.log", 'a', encoding='utf-8', buffering=1)
+        with lock:
+            log_file.write(f"# {time.strftime('%Y-%m-%d %H:%M:%S')} {command}\n")
+
+    def on_bytes_line(stream, line):
+        line = line.decode('utf-8', errors='replace').rstrip('\r')
+        if log_file is not None:
+            with lock:
+                log_file.write(line + '\n')
+        on_line(line, stream)
+
     try:
-        command = command.replace("$FILES", str(runtime.config.files))
+        yield on_bytes_line
+    finally:
+        if log_file is not None:
+            log_file.close()
+
+
+def local_run(command, *, stdin=None, can_fail=False, timeout=None, on_line=None):
+    # Command runs in files directory, cwd of pos itself is not changed, as it is shared by all threads.
+    command = command.replace("$FILES", str(runtime.config.files))
+    with _line_handler(LOCAL_LOG_NAME, command, on_line) as on_bytes_line:
         command = ["/bin/bash", "-c", command]
-        p = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        try:
-            stdout_bytes, stderr_bytes = p.communicate(to_bytes(stdin), LOCAL_COMMAND_TIMEOUT)
-        except subprocess.TimeoutExpired:
-            p.kill()
-            stdout_bytes, stderr_bytes = p.communicate()
-        result = Result(p.returncode, stdout_bytes, stderr_bytes)
-        if result or can_fail:
+        seconds = timeouts.timeout(timeout=timeout)
+        p = start_process(command, cwd=runtime.config.files)
+        stdout_bytes, stderr_bytes = communicate(p, stdin, seconds, "local command", on_line=on_bytes_line)
+    result = Result(p.returncode, stdout_bytes, stderr_bytes)
+    if result or can_fail:
+        return result
+    else:
+        raise PossibleRuntimeError(f"Unexpected returncode '{p.returncode}'\nlocal command: {command}\nstdout: {result.stdout_bytes}\nstderr: {result.stderr_bytes}")
+
+
+def _operation(*, changes):
+    """Record duration and outcome of outermost Context operation in run report."""
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self._operation_depth or not report.enabled:
+                return method(self, *args, **kwargs)
+            self._operation_depth += 1
+            started = time.monotonic()
+            try:
+                result = method(self, *args, **kwargs)
+            except Exception as e:
+                report.operation(self.hostname, method.__name__, time.monotonic() - started, failed=True,
+                                 unreachable=isinstance(e, PossibleHostUnreachable))
+                raise
+            finally:
+                self._operation_depth -= 1
+            report.operation(self.hostname, method.__name__, time.monotonic() - started, changed=changes and result is True)
             return result
-        else:
-            raise PossibleRuntimeError(f"Unexpected returncode '{p.returncode}'\nlocal command: {command}\nstdout: {stdout_bytes}\nstderr: {stderr_bytes}")
-    finally:
-        os.chdir(old_cwd)
+        return wrapper
+
+    return decorator
+
+
+def _merge_lines(text, lines):
+    """Append lines, which are not present in text, like :func:`~possible.editors.append_line` with ``insert_empty_line_before=True``."""
+    text_lines = text.split('\n')
+    present = set(text_lines)
+    for line in lines:
+        if line in present:
+            continue
+        present.add(line)
+        if text_lines[-1] != '':
+            text_lines.append('')
+        text_lines.append(line)
+        text_lines.append('')
+    return '\n'.join(text_lines)
+
+
+def _replace_commands(temp_remote_filename, remote_filename, owner, group, follow_symlinks=True):
+    """Commands, which replace remote file by temporary file, written in the same directory.
+
+    Owner and group, which are None, are copied from existing file. With ``follow_symlinks`` symbolic link
+    is not replaced, file it points to is replaced instead, like it was written through link,
+    and replace fails, if link points to something else than regular file, like ``/dev/null``.
+    Without ``follow_symlinks`` symbolic link itself is replaced by file.
+    """
+    commands = list()
+    if owner is None or group is None:
+        commands.append(f"{{ [ ! -e {remote_filename} ] || chown --reference={remote_filename} -- {temp_remote_filename} ; }}")
+    if owner is not None or group is not None:
+        owner_group = (owner or '') + (':' + group if group else '')
+        commands.append(f"chown {owner_group} -- {temp_remote_filename}")
+    if follow_symlinks:
+        commands.append(f'target="$(readlink -f -- {remote_filename})"')
+        commands.append('{ [ ! -e "$target" ] || [ -f "$target" ] ; }')
+        commands.append(f'mv -f -T -- {temp_remote_filename} "$target"')
+    else:
+        commands.append(f"mv -f -T -- {temp_remote_filename} {remote_filename}")
+    return commands
+
+
+def _file_state(content, mode, owner, group):
+    """Desired state of remote file, as recorded in journal: ``(sha256, mode, owner, group)``."""
+    return hashlib.sha256(content).hexdigest(), f"{int(mode, 8):04o}", owner, group
+
+
+def _in_task(task_name, function, *args):
+    """Call function in worker thread on behalf of task, so its operations are reported under this task."""
+    runtime.current.task = task_name
+    return function(*args)
+
+
+def reboot_hosts(contexts, *, wait_seconds=180, reboot_command="reboot", batch_size=None):
+    """Reboot hosts and wait until all of them are up again.
+
+    Hosts in one batch are rebooted and waited for concurrently. Readiness is polled
+    with cheap TCP connects to the ssh port with exponential backoff, and boot is
+    confirmed over ssh only after the port answers. Hosts behind jump host are polled over ssh only.
+
+    Args:
+        contexts: List of :class:`Context` objects of hosts to reboot.
+        wait_seconds: How long to wait for each batch of hosts.
+        reboot_command: Command used to reboot host.
+        batch_size: How many hosts reboot at once, all hosts if None.
+
+    Raises:
+        :class:`~exceptions.PossibleRuntimeError`: When some hosts not rebooted in time.
+    """
+    assert wait_seconds > 30
+    contexts = list(contexts)
+    if not contexts:
+        return
+    for c in contexts:
+        if c.host.connection != 'ssh':
+            raise PossibleRuntimeError(f"Reboot host {c.hostname} with connection '{c.host.connection}' not supported.")
+    if batch_size is None:
+        batch_size = len(contexts)
+    task_name = runtime.current.task
+    for index in range(0, len(contexts), batch_size):
+        batch = contexts[index:index + batch_size]
+        if batch[0].check_mode:
+            for c in batch:
+                c.name("would reboot")
+            continue
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(batch)) as executor:
+            boot_times = list(executor.map(lambda c: _in_task(task_name, c._boot_time), batch))
+            for c in batch:
+                try:
+                    c.run(reboot_command, can_fail=True, changes=True)
+                except PossibleHostUnreachable:
+                    health.reset(c.hostname)
+            deadline = time.monotonic() + wait_seconds
+            futures = [executor.submit(_in_task, task_name, c._wait_for_reboot, boot_time, deadline) for c, boot_time in zip(batch, boot_times)]
+            failed = list()
+            for c, future in zip(batch, futures):
+                try:
+                    future.result()
+                except PossibleRuntimeError:
+                    failed.append(c.hostname)
+        if failed:
+            raise PossibleRuntimeError(f"Reboot hosts {', '.join(failed)} failed.")
+
+
+def _buffer(view):
+    """Return buffer of view without copy, if view covers whole buffer, internal use only, buffer may be mutable."""
+    if isinstance(view.obj, (bytes, bytearray)) and len(view.obj) == view.nbytes:
+        return view.obj
+    return view.tobytes()
+
+
+def _bytes_view(view):
+    """Return read-only view of immutable bytes, buffer of view is converted to bytes once, if it is mutable."""
+    if isinstance(view.obj, bytes) and len(view.obj) == view.nbytes:
+        return view
+    return memoryview(view.tobytes())
 
 
 class Result:
+    """Result of command.
+
+    Output is kept as read-only memoryview of buffer read from process, without copy,
+    :attr:`stdout_bytes` and :attr:`stderr_bytes` are always immutable bytes.
+    Text of stdout and stderr is decoded and stripped on first access, only requested form is kept,
+    :meth:`iter_lines` iterates over lines without decoding whole text at once.
+    """
+    __slots__ = ('returncode', 'stdout_view', 'stderr_view', '_stdout_raw', '_stderr_raw', '_stdout', '_stderr')
+
     def __init__(self, returncode, stdout_bytes, stderr_bytes):
         self.returncode = returncode
-        self.stdout_bytes = stdout_bytes
-        self.stderr_bytes = stderr_bytes
-        self.stdout_raw = stdout_bytes.decode(encoding="utf-8", errors="replace")
-        self.stderr_raw = stderr_bytes.decode(encoding="utf-8", errors="replace")
-        self.stdout = self.stdout_raw.strip()
-        self.stderr = self.stderr_raw.strip()
+        self.stdout_view = memoryview(stdout_bytes).toreadonly()
+        self.stderr_view = memoryview(stderr_bytes).toreadonly()
+        self._stdout_raw = None
+        self._stderr_raw = None
+        self._stdout = None
+        self._stderr = None
+
+    @property
+    def stdout_bytes(self):
+        self.stdout_view = _bytes_view(self.stdout_view)
+        return self.stdout_view.obj
+
+    @property
+    def stderr_bytes(self):
+        self.stderr_view = _bytes_view(self.stderr_view)
+        return self.stderr_view.obj
+
+    @property
+    def stdout_raw(self):
+        if self._stdout_raw is None:
+            self._stdout_raw = str(self.stdout_view, encoding="utf-8", errors="replace")
+        return self._stdout_raw
+
+    @property
+    def stderr_raw(self):
+        if self._stderr_raw is None:
+            self._stderr_raw = str(self.stderr_view, encoding="utf-8", errors="replace")
+        return self._stderr_raw
+
+    @property
+    def stdout(self):
+        if self._stdout is None:
+            if self._stdout_raw is not None:
+                self._stdout = self._stdout_raw.strip()
+            else:
+                self._stdout = str(self.stdout_view, encoding="utf-8", errors="replace").strip()
+        return self._stdout
+
+    @property
+    def stderr(self):
+        if self._stderr is None:
+            if self._stderr_raw is not None:
+                self._stderr = self._stderr_raw.strip()
+            else:
+                self._stderr = str(self.stderr_view, encoding="utf-8", errors="replace").strip()
+        return self._stderr
+
+    def iter_lines(self, stream='stdout'):
+        """Iterate over lines of ``'stdout'`` or ``'stderr'``, without line ends, decoding output by chunks of 1 MiB."""
+        if stream not in ('stdout', 'stderr'):
+            raise PossibleRuntimeError(f"Unknown stream '{stream}'.")
+        view = self.stdout_view if stream == 'stdout' else self.stderr_view
+        buffer = _buffer(view)
+        start = 0
+        end = len(buffer)
+        while start < end:
+            # Output is decoded by chunks, cut at line ends, so memory used is bounded by chunk size.
+            stop = buffer.rfind(b'\n', start, start + ITER_LINES_CHUNK_SIZE) + 1 if start + ITER_LINES_CHUNK_SIZE < end else end
+            if stop <= start:
+                stop = buffer.find(b'\n', start) + 1 or end
+            lines = str(view[start:stop], encoding="utf-8", errors="replace").split('\n')
+            if stop != end or lines[-1] == '':
+                lines.pop()
+            for line in lines:
+                yield line[:-1] if line.endswith('\r') else line
+            start = stop
 
     def __bool__(self):
         return self.returncode == 0
 
 
-class style:
-    RED = '\033[0;91m'
-    RESET = '\033[0m'
-
-
 class Context:
     def __init__(self, hostname):
         if hostname not in runtime.inventory.hosts:
             raise PossibleRuntimeError(f"Host '{hostname}' not found.")
-        self.max_hostname_len = len(max(runtime.hosts, key=len))
         self.host = runtime.inventory.hosts[hostname]
-        self.ssh = SSH(self.host)
+        self.transport = connect(self.host)
         self.hostname = hostname
+        self._cache = runtime.caches.setdefault(hostname, dict())
+        # Independent tasks of the same host may run in parallel, each loads and invalidates cached host state under this lock.
+        self._lock = self._cache.setdefault('lock', threading.RLock())
+        self._getent = self._cache.setdefault('getent', dict())
+        self._facts = self._cache.setdefault('facts', dict())
+        self.check_mode = runtime.config.args.check
+        self._check_mode_files = self._cache.setdefault('check_mode_files', dict())
+        self._prefetched = self._cache.setdefault('prefetched', dict())
+        self._operation_depth = 0
+        self.packages = Packages(self)
+        self.systemd = Systemd(self)
+        # Handlers and systemd changes are collected per task and host, not per context.
+        self._notified = self._cache.setdefault(('notified', runtime.current.task), set())
+        runtime.current.contexts.append(self)
+
+    def _task_finished(self):
+        if self.systemd._pending():
+            self.systemd.apply()
+        notified = set(self._notified)
+        self._notified.clear()
+        for handler_name in runtime.handlers:
+            if handler_name in notified:
+                if self.check_mode:
+                    self.name(f"would run handler {handler_name}")
+                else:
+                    runtime.handlers[handler_name](self)
+        if self.systemd._pending():
+            self.systemd.apply()
+
+    def notify(self, handler_name):
+        """Notify handler.
+
+        Each notified handler is called once per host at the end of task, after all task code,
+        handlers are called in order of definition in posfile. In check mode handlers are not called,
+        ``would run handler`` event is emitted for each notified handler instead.
 
-    def name(self, *args, **kwargs):
-        if not runtime.config.args.quiet:
-            print(f"{self.hostname:{self.max_hostname_len}} *", *args, file=sys.stdout, flush=True, **kwargs)
+        Args:
+            handler_name: Name of function decorated by :func:`~possible.decorators.handler`.
+        """
+        handler_name = handler_name.replace('_', '-')
+        if handler_name not in runtime.handlers:
+            raise PossibleRuntimeError(f"Handler '{handler_name}' not found.")
+        self._notified.add(handler_name)
+
+    # end, file and flush arguments of print() are accepted for compatibility with old posfiles,
+    # but ignored: each call is one event, rendered as one line by writer of events.
 
-    def warn(self, *args, **kwargs):
-        print(f"{style.RED}", end="", file=sys.stderr, flush=True)
-        print(f"{style.RED}{self.hostname:{self.max_hostname_len}} *", *args, file=sys.stderr, flush=True, **kwargs)
-        print(f"{style.RESET}", end="", file=sys.stderr, flush=True)
+    def name(self, *args, sep=' ', end=None, file=None, flush=None):
+        events.emit(self.hostname, 'info', *args, sep=sep)
 
-    def fatal(self, *args, **kwargs):
-        print(f"{style.RED}", end="", file=sys.stderr, flush=True)
-        print(f"{self.hostname:{self.max_hostname_len}} *", *args, file=sys.stderr, flush=True, **kwargs)
-        print(f"{style.RESET}", end="", file=sys.stderr, flush=True)
+    def warn(self, *args, sep=' ', end=None, file=None, flush=None):
+        events.emit(self.hostname, 'warn', *args, sep=sep)
+
+    def fatal(self, *args, sep=' ', end=None, file=None, flush=None):
+        events.emit(self.hostname, 'fatal', *args, sep=sep)
         if not runtime.config.args.quiet:
             raise PossibleRuntimeError(*args)
         else:
             sys.exit(1)
 
-    def run(self, command, *, stdin=None, can_fail=False):
-        returncode, stdout_bytes, stderr_bytes = self.ssh.run(command, stdin=stdin)
+    @_operation(changes=False)
+    def run(self, command, *, stdin=None, can_fail=False, timeout=None, on_line=None, max_output=None, changes=None):
+        """Run command on host.
+
+        Command is not simulated in check mode: command, which may change host, is not run at all,
+        and empty successful result is returned instead. For command run with ``changes=True``
+        ``would run`` event is emitted, command run without ``changes`` argument is not known to be read-only,
+        so warning is emitted, because task may depend on its output, which is empty in check mode.
+        Read-only commands, which output is needed in check mode too, must be run with ``changes=False``.
+
+        Args:
+            command: Shell command.
+            stdin: Optional data for stdin of command.
+            can_fail: Return result with non-zero returncode instead of raising exception.
+            timeout: Seconds to wait for command, by default ``timeout`` setting of host or ``--timeout``.
+            on_line: Optional callback ``on_line(line, stream)``, called with each line of output as soon as it is read,
+                without line end, ``stream`` is ``'stdout'`` or ``'stderr'``. Streamed output is appended
+                to ``HOST.log`` file in ``--log-dir`` directory, if it is set.
+            max_output: Keep only last ``max_output`` bytes of stdout and stderr in result.
+            changes: False if command never changes host, so it is run in check mode too,
+                True if it may change host.
+
+        Raises:
+            :class:`~exceptions.PossibleTimeout`: When command not finished in time, it is killed.
+        """
+        if self.check_mode and changes is not False:
+            if changes:
+                self.name(f"would run {command}")
+            else:
+                self.warn(f"skipped in check mode, empty output returned, run read-only command with changes=False: {command}")
+            return Result(0, b'', b'')
+        with _line_handler(self.hostname, command, on_line) as on_bytes_line:
+            returncode, stdout_bytes, stderr_bytes = self.transport.run(command, stdin=stdin, timeout=timeout, on_line=on_bytes_line, max_output=max_output)
+        if ACCOUNT_COMMANDS.search(command):
+            with self._lock:
+                self._getent.clear()
+        if PACKAGE_COMMANDS.search(command):
+            self.packages._invalidate()
         result = Result(returncode, stdout_bytes, stderr_bytes)
         if result or can_fail:
             return result
         else:
-            raise PossibleRuntimeError(f"Unexpected returncode '{returncode}'\ncommand: {command}\nstdout: {stdout_bytes}\nstderr: {stderr_bytes}")
+            raise PossibleRuntimeError(f"Unexpected returncode '{returncode}'\ncommand: {command}\nstdout: {result.stdout_bytes}\nstderr: {result.stderr_bytes}")
+
+    @_operation(changes=False)
+    def stream(self, command, *, stdin=None, can_fail=False, timeout=None, changes=None):
+        """Run command on host and show each line of its output as host event, as soon as it is read.
+
+        Useful for long-running commands, like package upgrades.
+        Only last 1 MiB of stdout and stderr is kept in result.
+        """
+        return self.run(command, stdin=stdin, can_fail=can_fail, timeout=timeout, changes=changes,
+                        on_line=lambda line, stream: self.name(line), max_output=STREAM_MAX_OUTPUT)
 
+    @_operation(changes=False)
     def all_ip_addresses(self):
-        return self.run("hostname --all-ip-addresses").stdout.split()
+        return self.run("hostname --all-ip-addresses", changes=False).stdout.split()
 
+    @_operation(changes=False)
     def is_hardware_node(self):
-        return self.run("systemd-detect-virt", can_fail=True).stdout == "none"
+        return self.run("systemd-detect-virt", can_fail=True, changes=False).stdout == "none"
 
+    @_operation(changes=False)
     def is_virtual_machine(self):
-        return self.run("systemd-detect-virt", can_fail=True).stdout == "kvm"
+        return self.run("systemd-detect-virt", can_fail=True, changes=False).stdout == "kvm"
 
+    @_operation(changes=False)
     def is_file(self, remote_filename):
-        return self.run(f"""if [ -f {remote_filename} ]; then echo "True"; fi""").stdout == "True"
+        return self.run(f"""if [ -f {remote_filename} ]; then echo "True"; fi""", changes=False).stdout == "True"
 
+    @_operation(changes=False)
     def is_executable_file(self, remote_filename):
-        return self.run(f"""if [ -f {remote_filename} ] && [ -x {remote_filename} ]; then echo "True"; fi""").stdout == "True"
+        return self.run(f"""if [ -f {remote_filename} ] && [ -x {remote_filename} ]; then echo "True"; fi""", changes=False).stdout == "True"
 
+    @_operation(changes=False)
     def is_link(self, remote_filename):
-        return self.run(f"""if [ -L {remote_filename} ]; then echo "True"; fi""").stdout == "True"
+        return self.run(f"""if [ -L {remote_filename} ]; then echo "True"; fi""", changes=False).stdout == "True"
 
     def is_dir(self, remote_filename):
         return self.is_directory(remote_filename)
 
+    @_operation(changes=False)
     def is_directory(self, remote_filename):
-        return self.run(f"""if [ -d {remote_filename} ]; then echo "True"; fi""").stdout == "True"
+        return self.run(f"""if [ -d {remote_filename} ]; then echo "True"; fi""", changes=False).stdout == "True"
 
+    @_operation(changes=False)
     def is_reboot_required(self):
         if self.fact('systemd-nspawn'):
             # workaround of bug https://bugzilla.redhat.com/show_bug.cgi?id=1913962
             return False
         if not self.is_file("/usr/bin/needs-restarting"):
-            self.run("yum install yum-utils -y")
-        result = self.run("/usr/bin/needs-restarting --reboothint", can_fail=True)
+            self.packages.install('yum-utils')
+            if self.check_mode:
+                return False
+        result = self.run("/usr/bin/needs-restarting --reboothint", can_fail=True, changes=False)
         return result.returncode == 1
 
+    @_operation(changes=True)
     def reboot(self, *, wait_seconds=180, reboot_command="reboot"):
-        assert wait_seconds > 30
-        old_uptime = self.run('stat --printf="%y" /proc/1/cmdline').stdout
-        self.run(reboot_command, can_fail=True)
-        while wait_seconds > 0:
-            time.sleep(1)
-            result = self.run('stat --printf="%y" /proc/1/cmdline', can_fail=True)
-            if result:
-                current_uptime = result.stdout
-                if old_uptime != current_uptime:
-                    return
-            wait_seconds = wait_seconds - 1
+        reboot_hosts([self], wait_seconds=wait_seconds, reboot_command=reboot_command)
+
+    def _boot_time(self, *, can_fail=False, timeout=None):
+        result = self.run('stat --printf="%y" /proc/1/cmdline', can_fail=can_fail, timeout=timeout, changes=False)
+        if result:
+            return result.stdout
+        return None
+
+    def _is_port_open(self, timeout):
+        try:
+            with socket.create_connection((self.host.host, self.host.port), timeout=timeout):
+                return True
+        except OSError:
+            return False
+
+    def _wait_for_reboot(self, old_boot_time, deadline):
+        delay = REBOOT_POLL_MIN_DELAY
+        while time.monotonic() < deadline:
+            time.sleep(min(delay, max(deadline - time.monotonic(), 0)))
+            delay = min(delay * 2, REBOOT_POLL_MAX_DELAY)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            # Host behind jump host is not reachable directly, it is polled over ssh only.
+            if self.host.jump_host is None and not self._is_port_open(timeout=min(delay, remaining)):
+                continue
+            try:
+                # Every poll is limited by reboot deadline, so host hanging while booting does not hold reboot for default timeout.
+                boot_time = self._boot_time(can_fail=True, timeout=max(deadline - time.monotonic(), REBOOT_POLL_MIN_DELAY))
+            except PossibleHostUnreachable:
+                health.reset(self.hostname)
+                continue
+            except PossibleTimeout:
+                continue
+            if boot_time is not None and boot_time != old_boot_time:
+                return
         raise PossibleRuntimeError(f"Reboot host {self.hostname} failed.")
 
-    def copy(self, local_filename, remote_filename, *, mode='0644'):
+    def _stat(self, remote_filename):
+        result = self.run(f"stat -L --printf='%F:%a:%U:%G' -- {remote_filename}", can_fail=True, changes=False)
+        if not result:
+            return None
+        kind, mode, owner, group = result.stdout.split(':')
+        if kind.startswith('regular'):
+            kind = 'file'
+        return kind, f"{int(mode, 8):04o}", owner, group
+
+    def _download(self, remote_filename):
+        return self.transport.read(remote_filename)
+
+    def _remote_file(self, remote_filename):
+        if remote_filename in self._check_mode_files:
+            return self._check_mode_files[remote_filename]
+        if self.check_mode:
+            # Nothing is changed in check mode, so files read once are valid until end of run.
+            if remote_filename not in self._prefetched:
+                self._prefetch([remote_filename])
+            return self._prefetched[remote_filename]
+        stat = self._stat(remote_filename)
+        if stat is None or stat[0] != 'file':
+            return None, None
+        return stat, self._download(remote_filename)
+
+    def _prefetch(self, remote_filenames):
+        files, dummy_directories = self._get_many(remote_filenames)
+        for remote_filename in remote_filenames:
+            info, content = files.get(remote_filename, (None, None))
+            if info is None or not info.isfile():
+                self._prefetched[remote_filename] = (None, None)
+            else:
+                stat = ('file', f"{info.mode & 0o7777:04o}", info.uname or str(info.uid), info.gname or str(info.gid))
+                self._prefetched[remote_filename] = (stat, content)
+
+    @_operation(changes=False)
+    def prefetch(self, *remote_filenames):
+        """Read many remote files with one remote call in check mode, so later :meth:`put` and :meth:`copy`
+        of them compare content without own round trips. Outside of check mode does nothing,
+        there files are read by each call just before they are changed.
+        """
+        if not self.check_mode:
+            return
+        for remote_filename in remote_filenames:
+            if not os.path.isabs(remote_filename):
+                raise PossibleRuntimeError(f"Remote filename must be absolute: {remote_filename}")
+        remote_filenames = [remote_filename for remote_filename in remote_filenames if remote_filename not in self._prefetched]
+        if remote_filenames:
+            self._prefetch(remote_filenames)
+
+    def _ensure_attributes(self, remote_filename, stat, *, mode, owner, group):
+        changed = False
+        if int(stat[1], 8) != int(mode, 8):
+            changed = self.chmod(remote_filename, mode=mode)
+        if owner is not None and owner != stat[2] or group is not None and group != stat[3]:
+            owner = owner if owner is not None else stat[2]
+            group = group if group is not None else stat[3]
+            changed = self.chown(remote_filename, owner=owner, group=group) or changed
+        return changed
+
+    def _install(self, content, remote_filename, *, mode, owner, group):
+        dirname, basename = os.path.split(remote_filename)
+        temp_remote_filename = os.path.join(dirname, f".{basename}.possible-{uuid.uuid4().hex[:12]}.tmp")
+        self.transport.write(content, temp_remote_filename)
+        commands = [f"chmod {mode} -- {temp_remote_filename}"]
+        commands.extend(_replace_commands(temp_remote_filename, remote_filename, owner, group))
+        self.run(f"if ! {{ {' && '.join(commands)} ; }} ; then rm -f -- {temp_remote_filename} ; exit 1 ; fi", changes=True)
+
+    def _get_many(self, remote_filenames, *, directories=(), dereference=True):
+        """Read many remote files and check many remote directories with one remote call.
+
+        Args:
+            remote_filenames: Remote file names, must be absolute.
+            directories: Remote directory names to check, must be absolute.
+            dereference: Read files, which symbolic links point to. Otherwise symbolic links are returned
+                as ``(tarfile.TarInfo, None)``, with link target in ``linkname`` of info.
+
+        Returns:
+            Tuple ``(files, existing_directories)``, where files is dict ``{remote_filename: tarfile.TarInfo, content}``
+            of existing remote files and existing_directories is set of existing directories.
+        """
+        commands = list()
+        for dirname in directories:
+            commands.append(f"if [ -d {dirname} ] ; then echo 'D {dirname}' ; fi")
+        tar_options = '-c -h -P --no-recursion' if dereference else '-c -P --no-recursion'
+        commands.append(f"printf 'T %s\\n' \"$(tar {tar_options} --ignore-failed-read -f - -- {' '.join(remote_filenames)} 2>/dev/null | base64 -w0)\"")
+        files = dict()
+        existing_directories = set()
+        for line in self.run(' ; '.join(commands), changes=False).stdout.splitlines():
+            line = line.strip()
+            if line.startswith('D '):
+                existing_directories.add(line[2:])
+            elif line.startswith('T ') and line[2:]:
+                with tarfile.open(fileobj=io.BytesIO(base64.b64decode(line[2:]))) as archive:
+                    for info in archive:
+                        if info.isfile():
+                            files[info.name] = (info, archive.extractfile(info).read())
+                        elif info.issym():
+                            files[info.name] = (info, None)
+        return files, existing_directories
+
+    def _put_many(self, files, *, directories=None, command=None, follow_symlinks=True):
+        """Atomically write many remote files with one remote command, tar archive of files is passed to its stdin.
+
+        Args:
+            files: Dict ``{remote_filename: (content, mode, owner, group)}``, owner and group may be None,
+                then owner and group of existing file are kept, or root is used for new file.
+            directories: Optional dict ``{remote_dirname: (mode, owner, group)}`` of directories to create before files.
+            command: Optional command to run after all files are written.
+            follow_symlinks: Write files through symbolic links, otherwise replace links by files.
+
+        Returns:
+            :class:`Result` of remote command.
+        """
+        temp_suffix = f".possible-{uuid.uuid4().hex[:12]}.tmp"
+        renames = list()
+        archive_file = io.BytesIO()
+        with tarfile.open(fileobj=archive_file, mode='w') as archive:
+            for remote_dirname, (mode, owner, group) in (directories or dict()).items():
+                if not os.path.isabs(remote_dirname):
+                    raise PossibleRuntimeError(f"Remote dirname must be absolute: {remote_dirname}")
+                info = tarfile.TarInfo(remote_dirname.lstrip('/'))
+                info.type = tarfile.DIRTYPE
+                info.mode = int(mode, 8)
+                info.mtime = time.time()
+                info.uname = owner or 'root'
+                info.gname = group or 'root'
+                archive.addfile(info)
+            for remote_filename, (content, mode, owner, group) in files.items():
+                if not os.path.isabs(remote_filename):
+                    raise PossibleRuntimeError(f"Remote filename must be absolute: {remote_filename}")
+                dirname, basename = os.path.split(remote_filename)
+                temp_remote_filename = os.path.join(dirname, f".{basename}{temp_suffix}")
+                content = to_bytes(content)
+                info = tarfile.TarInfo(temp_remote_filename.lstrip('/'))
+                info.size = len(content)
+                info.mode = int(mode, 8)
+                info.mtime = time.time()
+                info.uname = owner or 'root'
+                info.gname = group or 'root'
+                archive.addfile(info, io.BytesIO(content))
+                renames.append((temp_remote_filename, remote_filename, owner, group))
+        commands = ["tar -x -f - -C /"]
+        for temp_remote_filename, remote_filename, owner, group in renames:
+            commands.extend(_replace_commands(temp_remote_filename, remote_filename, owner, group, follow_symlinks))
+        temp_remote_filenames = ' '.join(rename[0] for rename in renames)
+        script = f"if ! {{ {' && '.join(commands)} ; }} ; then rm -f -- {temp_remote_filenames} ; exit 1 ; fi"
+        if command is not None:
+            script = script + f" ; {command}"
+        # Files written here are not recorded by copy() or put(), so their journal state is stale now.
+        for remote_filename in files:
+            self._forget(f"file:{remote_filename}")
+        return self.run(script, stdin=archive_file.getvalue(), changes=True)
+
+    def _report_change(self, remote_filename, old_content, new_content):
+        if old_content is None:
+            self.name(f"would create {remote_filename}")
+            return
+        self.name(f"would change {remote_filename}")
+        try:
+            old_lines = to_text(old_content).splitlines(keepends=True)
+            new_lines = to_text(new_content).splitlines(keepends=True)
+        except UnicodeDecodeError:
+            self.name(f"binary file {remote_filename} differs")
+            return
+        for line in difflib.unified_diff(old_lines, new_lines, fromfile=remote_filename, tofile=remote_filename):
+            self.name(line.rstrip('\n'))
+
+    def _is_applied(self, resource, state):
+        if runtime.journal is None or not runtime.config.args.incremental:
+            return False
+        entry = runtime.journal.resource(self.hostname, resource)
+        return entry is not None and entry[0] == state and time.time() - entry[1] < runtime.config.args.verify_interval
+
+    def _applied(self, resource, state):
+        if runtime.journal is not None and runtime.config.args.incremental and not self.check_mode:
+            runtime.journal.resource_applied(self.hostname, resource, state)
+
+    def _forget(self, resource):
+        if runtime.journal is not None and runtime.config.args.incremental and not self.check_mode:
+            runtime.journal.resource_forgotten(self.hostname, resource)
+
+    @_operation(changes=True)
+    def copy(self, local_filename, remote_filename, *, mode='0644', owner=None, group=None):
+        if not isinstance(mode, str) or not mode.isnumeric():
+            raise PossibleRuntimeError(f"Mode must be string, like '0644'.")
         if os.path.isabs(local_filename):
             raise PossibleRuntimeError(f"Local filename must be relative: {local_filename}")
         local_filename = str(runtime.config.files / local_filename)
         if not os.path.isabs(remote_filename):
             raise PossibleRuntimeError(f"Remote filename must be absolute: {remote_filename}")
-        if self.is_file(remote_filename):
-            local_file = open(local_filename, mode="rb")
-            local_content = local_file.read()
-            local_file.close()
-            remote_content = self.get(remote_filename, as_bytes=True)
-            if local_content == remote_content:
-                changed = self.chmod(remote_filename, mode=mode)
-                return changed
-        returncode, stdout_bytes, stderr_bytes = self.ssh.put(local_filename, remote_filename)
-        if returncode != 0:
-            raise PossibleRuntimeError(f"Unexpected returncode '{returncode}'\ncommand: copy({local_filename}, {remote_filename})\nstdout: {stdout_bytes}\nstderr: {stderr_bytes}")
-        self.chmod(remote_filename, mode=mode)
+        if not os.path.isfile(local_filename):
+            raise PossibleFileNotFound(f"Local file does not exist: {local_filename}")
+        local_file = open(local_filename, mode="rb")
+        local_content = local_file.read()
+        local_file.close()
+        resource, state = f"file:{remote_filename}", _file_state(local_content, mode, owner, group)
+        if self._is_applied(resource, state):
+            return False
+        stat, remote_content = self._remote_file(remote_filename)
+        if local_content == remote_content:
+            changed = self._ensure_attributes(remote_filename, stat, mode=mode, owner=owner, group=group)
+            self._applied(resource, state)
+            return changed
+        if self.check_mode:
+            self._report_change(remote_filename, remote_content, local_content)
+            self._check_mode_files[remote_filename] = (('file', mode, owner, group), local_content)
+            return True
+        self._install(local_content, remote_filename, mode=mode, owner=owner, group=group)
+        self._applied(resource, state)
         return True
 
-    def put(self, content, remote_filename, *, mode='0644'):
+    @_operation(changes=True)
+    def put(self, content, remote_filename, *, mode='0644', owner=None, group=None):
         if not isinstance(mode, str) or not mode.isnumeric():
             raise PossibleRuntimeError(f"Mode must be string, like '0644'.")
         if not os.path.isabs(remote_filename):
             raise PossibleRuntimeError(f"Remote filename must be absolute: {remote_filename}")
-        if self.is_file(remote_filename):
-            local_content = to_bytes(content)
-            remote_content = self.get(remote_filename, as_bytes=True)
-            if local_content == remote_content:
-                return False # TODO FIX BUG: not change mode if content is identical
-        fd, temp_filename = tempfile.mkstemp(suffix='.tmp', prefix='possible-', dir='/tmp')
-        try:
-            temp_file = os.fdopen(fd, mode='wb')
-            temp_file.write(to_bytes(content))
-            temp_file.close()
-            os.chmod(temp_filename, int(mode, 8))
-            returncode, stdout_bytes, stderr_bytes = self.ssh.put(temp_filename, remote_filename)
-            if returncode != 0:
-                raise PossibleRuntimeError(f"Unexpected returncode '{returncode}'\ncommand: put('{content}', {remote_filename})\nstdout: {stdout_bytes}\nstderr: {stderr_bytes}")
-            else:
-                return True
-        finally:
-            os.remove(temp_filename)
+        local_content = to_bytes(content)
+        resource, state = f"file:{remote_filename}", _file_state(local_content, mode, owner, group)
+        if self._is_applied(resource, state):
+            return False
+        stat, remote_content = self._remote_file(remote_filename)
+        if local_content == remote_content:
+            changed = self._ensure_attributes(remote_filename, stat, mode=mode, owner=owner, group=group)
+            self._applied(resource, state)
+            return changed
+        if self.check_mode:
+            self._report_change(remote_filename, remote_content, local_content)
+            self._check_mode_files[remote_filename] = (('file', mode, owner, group), local_content)
+            return True
+        self._install(local_content, remote_filename, mode=mode, owner=owner, group=group)
+        self._applied(resource, state)
+        return True
 
+    @_operation(changes=False)
     def get(self, remote_filename, default_value=None, *, as_bytes=False):
         if not os.path.isabs(remote_filename):
             raise PossibleRuntimeError(f"Remote filename must be absolute: {remote_filename}")
-        if not self.is_file(remote_filename):
+        if remote_filename in self._check_mode_files or self.check_mode:
+            stat, content = self._remote_file(remote_filename)
+            if stat is None:
+                if default_value is None:
+                    raise PossibleFileNotFound(f"Remote file does not exist: {remote_filename}")
+                return default_value
+        elif not self.is_file(remote_filename):
             if default_value is None:
                 raise PossibleFileNotFound(f"Remote file does not exist: {remote_filename}")
             else:
                 return default_value
-        fd, temp_filename = tempfile.mkstemp(suffix='.tmp', prefix='possible-', dir='/tmp')
-        try:
-            returncode, stdout_bytes, stderr_bytes = self.ssh.get(remote_filename, temp_filename)
-            if returncode != 0:
-                raise PossibleRuntimeError(f"Unexpected returncode '{returncode}'\ncommand: get({remote_filename})\nstdout: {stdout_bytes}\nstderr: {stderr_bytes}")
-            temp_file = os.fdopen(fd, mode="rb")
-            content = temp_file.read()
-            temp_file.close()
-            if as_bytes:
-                return content
-            else:
-                return to_text(content)
-        finally:
-            os.remove(temp_filename)
+        else:
+            content = self._download(remote_filename)
+        if as_bytes:
+            return content
+        else:
+            return to_text(content)
 
     def read(self, local_filename, default_value=None, *, as_bytes=False):
         if os.path.isabs(local_filename):
@@ -223,6 +804,7 @@ class Context:
         else:
             return to_text(content)
 
+    @_operation(changes=True)
     def edit(self, remote_filename, *editors):
         old_text = self.get(remote_filename)
         changed, new_text = _apply_editors(old_text, *editors)
@@ -230,22 +812,41 @@ class Context:
             self.put(new_text, remote_filename)
         return changed
 
+    @_operation(changes=True)
     def chown(self, remote_filename, *, owner='root', group='root'):
         if not os.path.isabs(remote_filename):
             raise PossibleRuntimeError(f"Remote filename must be absolute: {remote_filename}")
-        stdout = self.run('chown --changes ' + owner.strip() + ':' + group.strip() + ' -- ' + remote_filename).stdout
+        if self.check_mode:
+            stat = self._stat(remote_filename)
+            if stat is not None and stat[2:] == (owner.strip(), group.strip()):
+                return False
+            self.name(f"would chown {owner.strip()}:{group.strip()} {remote_filename}")
+            return True
+        stdout = self.run('chown --changes ' + owner.strip() + ':' + group.strip() + ' -- ' + remote_filename, changes=True).stdout
         changed = stdout != ""
+        if changed:
+            self._forget(f"file:{remote_filename}")
         return changed
 
+    @_operation(changes=True)
     def chmod(self, remote_filename, *, mode='0644'):
         if not isinstance(mode, str) or not mode.isnumeric():
             raise PossibleRuntimeError(f"Mode must be string, like '0644'.")
         if not os.path.isabs(remote_filename):
             raise PossibleRuntimeError(f"Remote filename must be absolute: {remote_filename}")
-        stdout = self.run('chmod --changes ' + mode + ' -- ' + remote_filename).stdout
+        if self.check_mode:
+            stat = self._stat(remote_filename)
+            if stat is not None and int(stat[1], 8) == int(mode, 8):
+                return False
+            self.name(f"would chmod {mode} {remote_filename}")
+            return True
+        stdout = self.run('chmod --changes ' + mode + ' -- ' + remote_filename, changes=True).stdout
         changed = stdout != ""
+        if changed:
+            self._forget(f"file:{remote_filename}")
         return changed
 
+    @_operation(changes=True)
     def sysctl(self, line):
         line = line.strip()
         if '\n' in line:
@@ -253,15 +854,49 @@ class Context:
         if '=' not in line:
             raise PossibleRuntimeError(f"sysctl setting must be in form 'name = value'")
         name, value = line.split('=')
-        name = name.strip()
-        value = value.strip()
-        line = f"\n{name} = {value}\n\n"
-        filename = f"/etc/sysctl.d/{name}.conf"
-        changed = self.put(line, filename)
-        if changed:
-            self.name(f"tune {name} = {value}")
-            self.run(f"sysctl -p {filename}")
-        return changed
+        return self.sysctl_many({name: value})
+
+    @_operation(changes=True)
+    def sysctl_many(self, settings):
+        """Tune many sysctl settings at once.
+
+        Each setting is stored in own file ``/etc/sysctl.d/${name}.conf``.
+        Current files and live values of all settings are read by one remote call,
+        all changed files are written by one bulk transfer and applied by one ``sysctl -p`` call.
+
+        Args:
+            settings: Dict of sysctl settings, ``{name: value}``.
+
+        Returns:
+            True if any setting changed, False otherwise.
+        """
+        wanted = dict()
+        for name, value in settings.items():
+            name = str(name).strip()
+            value = str(value).strip()
+            if not name or '\n' in value or '=' in name or '/' in name or ' ' in name:
+                raise PossibleRuntimeError(f"Invalid sysctl setting '{name} = {value}'")
+            wanted[name] = value
+        if not wanted:
+            return False
+        commands = list()
+        for name in wanted:
+            filename = f"/etc/sysctl.d/{name}.conf"
+            commands.append(f'printf "%s %s\\n" "$( {{ sha1sum < {filename} || echo missing ; }} 2>/dev/null | cut -c1-40 )" "$(sysctl -n {name} 2>/dev/null)"')
+        lines = self.run(' ; '.join(commands), changes=False).stdout.splitlines()
+        files = dict()
+        for name, line in zip(wanted, lines):
+            fields = line.split()
+            current_hash, current_value = fields[0], ' '.join(fields[1:])
+            content = to_bytes(f"\n{name} = {wanted[name]}\n\n")
+            if current_hash != hashlib.sha1(content).hexdigest() or current_value != ' '.join(wanted[name].split()):
+                files[f"/etc/sysctl.d/{name}.conf"] = (content, '0644', None, None)
+                self.name(f"{'would tune' if self.check_mode else 'tune'} {name} = {wanted[name]}")
+        if not files:
+            return False
+        if not self.check_mode:
+            self._put_many(files, command=f"sysctl -p {' '.join(files)} >/dev/null")
+        return True
 
     def var_defined(self, key):
         return key in self.host.vars
@@ -271,15 +906,22 @@ class Context:
 
     def _MemTotal_KiB(self):
             #print(self.run("cat /proc/meminfo").stdout)
-            string = self.run("cat /proc/meminfo").stdout.splitlines()[0].split()[1]
+            string = self.run("cat /proc/meminfo", changes=False).stdout.splitlines()[0].split()[1]
             result = int(string)
             assert result > 0
             return result
 
+    @_operation(changes=False)
     def fact(self, key):
+        with self._lock:
+            if key not in self._facts:
+                self._facts[key] = self._fact(key)
+            return self._facts[key]
+
+    def _fact(self, key):
         if key == 'virt':
             """ https://www.freedesktop.org/software/systemd/man/systemd-detect-virt.html """
-            return self.run('systemd-detect-virt', can_fail=True).stdout
+            return self.run('systemd-detect-virt', can_fail=True, changes=False).stdout
         elif key == 'kvm':
             return self.fact('virt') == 'kvm'
         elif key == 'systemd-nspawn':
@@ -287,7 +929,7 @@ class Context:
         elif key == 'openvz':
             return self.fact('virt') == 'openvz'
         elif key == 'vm':
-            result = self.run('systemd-detect-virt --vm', can_fail=True)
+            result = self.run('systemd-detect-virt --vm', can_fail=True, changes=False)
             if result.returncode == 0:
                 return result.stdout
             else:
@@ -301,6 +943,36 @@ class Context:
         else:
             raise KeyError(f"Unknown fact key '{key}'.")
 
+    @_operation(changes=False)
+    def getent(self, database):
+        """get account database
+
+        Database fetched from remote host only once per run and cached.
+        Cache is invalidated after any ``useradd``, ``usermod``, ``userdel``,
+        ``groupadd``, ``groupmod``, ``groupdel`` or ``gpasswd`` command run via this context.
+
+        Args:
+            database: ``passwd`` or ``group``
+
+        Returns:
+            Dict of database entries, keyed by name, each entry is list of fields.
+        """
+        if database not in ACCOUNT_DATABASES:
+            raise PossibleRuntimeError(f"Unknown account database '{database}'.")
+        with self._lock:
+            if database not in self._getent:
+                entries = dict()
+                for line in self.run(f"getent {database}", changes=False).iter_lines():
+                    line = line.strip()
+                    if not line:
+                        continue
+                    fields = line.split(":")
+                    if fields[0] not in entries:
+                        entries[fields[0]] = fields
+                self._getent[database] = entries
+            return self._getent[database]
+
+    @_operation(changes=False)
     def is_user_exists(self, name):
         """is user exists?
 
@@ -310,15 +982,9 @@ class Context:
         Returns:
             True if user exists, False if user not exists.
         """
-        passwd = self.run("getent passwd").stdout
-        for line in passwd.split("\n"):
-            line = line.strip()
-            if not line:
-                continue
-            if line.split(":")[0] == name:
-                return True
-        return False
+        return name in self.getent('passwd')
 
+    @_operation(changes=False)
     def is_group_exists(self, name):
         """is group exists?
 
@@ -328,15 +994,9 @@ class Context:
         Returns:
             True if group exists, False if group not exists.
         """
-        group = self.run("getent group").stdout
-        for line in group.split("\n"):
-            line = line.strip()
-            if not line:
-                continue
-            if line.split(":")[0] == name:
-                return True
-        return False
+        return name in self.getent('group')
 
+    @_operation(changes=False)
     def user_home_directory(self, name):
         """get user home directory
 
@@ -346,48 +1006,84 @@ class Context:
         Returns:
             Home directory if user exists or None if user not exists.
         """
-        passwd = self.run("getent passwd").stdout
-        for line in passwd.split("\n"):
-            line = line.strip()
-            if not line:
-                continue
-            if line.split(":")[0] == name:
-                return line.split(":")[5]
+        passwd = self.getent('passwd')
+        if name in passwd:
+            return passwd[name][5]
         raise PossibleRuntimeError(f"User '{name}' not found.")
 
+    @_operation(changes=True)
     def add_to_authorized_keys(self, local_public_keys_filename, username, remote_authorized_keys_filename="~/.ssh/authorized_keys"):
-        if os.path.isabs(local_public_keys_filename):
-            raise PossibleRuntimeError(f"Local public keys filename must be relative: {local_public_keys_filename}")
-        if remote_authorized_keys_filename.startswith('~'):
-            home_directory = self.user_home_directory(username).rstrip('/')
-            remote_authorized_keys_filename = remote_authorized_keys_filename.lstrip('~')
-            remote_authorized_keys_filename = home_directory + remote_authorized_keys_filename
-        if not os.path.isabs(remote_authorized_keys_filename):
-            raise PossibleRuntimeError(f"Remote filename must be absolute: {remote_authorized_keys_filename}")
-        dirname = os.path.dirname(remote_authorized_keys_filename)
-        if not self.is_directory(dirname):
-            self.run(f"mkdir {dirname}")
-            if os.path.basename(dirname) == '.ssh':
-                self.chown(dirname, owner=username, group=username)
-                self.chmod(dirname, mode="0700")
-            else:  # shared dir for authorized keys
-                self.chown(dirname, owner="root", group="root")
-                self.chmod(dirname, mode="0755")
-        old_content = self.get(remote_authorized_keys_filename, "")
-        new_content = old_content
-        keys = self.read(local_public_keys_filename)
-        for key in keys.split("\n"):
-            key = key.strip()
-            if not key:
-                continue
-            new_content = edit(new_content, append_line(key, insert_empty_line_before=True))
-        if new_content != old_content:
-            self.put(new_content, remote_authorized_keys_filename, mode="0600")
-            self.chown(remote_authorized_keys_filename, owner=username, group=username)
-            return True
-        else:
+        return self.add_to_authorized_keys_many({username: local_public_keys_filename}, remote_authorized_keys_filename)
+
+    @_operation(changes=True)
+    def add_to_authorized_keys_many(self, public_keys, remote_authorized_keys_filename="~/.ssh/authorized_keys"):
+        """Add public keys to authorized keys of many users at once.
+
+        All authorized keys files are read by one remote call, keys are merged locally
+        and all changed files are written by one bulk transfer.
+
+        Args:
+            public_keys: Dict ``{username: local_public_keys_filename}``, local filenames must be relative.
+            remote_authorized_keys_filename: Remote authorized keys filename, ``~`` is replaced with user home directory.
+
+        Returns:
+            True if any authorized keys file changed, False otherwise.
+        """
+        targets = dict()
+        for username, local_public_keys_filename in public_keys.items():
+            if os.path.isabs(local_public_keys_filename):
+                raise PossibleRuntimeError(f"Local public keys filename must be relative: {local_public_keys_filename}")
+            filename = remote_authorized_keys_filename
+            if filename.startswith('~'):
+                home_directory = self.user_home_directory(username).rstrip('/')
+                filename = home_directory + filename.lstrip('~')
+            if not os.path.isabs(filename):
+                raise PossibleRuntimeError(f"Remote filename must be absolute: {filename}")
+            targets[username] = filename
+        if not targets:
+            return False
+        dirnames = sorted(set(os.path.dirname(filename) for filename in targets.values()))
+        remote_files, existing_directories = self._get_many(list(targets.values()), directories=dirnames)
+        directories = dict()
+        files = dict()
+        for username, filename in targets.items():
+            dirname = os.path.dirname(filename)
+            if dirname not in existing_directories and dirname not in directories:
+                if os.path.basename(dirname) == '.ssh':
+                    directories[dirname] = ('0700', username, username)
+                else:  # shared dir for authorized keys
+                    directories[dirname] = ('0755', 'root', 'root')
+            keys = list()
+            for key in self.read(public_keys[username]).split("\n"):
+                key = key.strip()
+                if key:
+                    keys.append(key)
+            if filename in remote_files:
+                info, old_content = remote_files[filename]
+                old_text = to_text(old_content)
+                attributes_changed = info.mode & 0o7777 != 0o600 or info.uname != username or info.gname != username
+            else:
+                old_content = None
+                old_text = ""
+                attributes_changed = True
+            new_text = _merge_lines(old_text, keys)
+            if new_text != old_text or attributes_changed:
+                files[filename] = (new_text, '0600', username, username)
+                if self.check_mode:
+                    if new_text != old_text:
+                        self._report_change(filename, old_content, to_bytes(new_text))
+                    else:
+                        self.name(f"would chmod 0600 and chown {username}:{username} {filename}")
+        if not files:
             return False
+        if self.check_mode:
+            for dirname in directories:
+                self.name(f"would create directory {dirname}")
+        else:
+            self._put_many(files, directories=directories)
+        return True
 
+    @_operation(changes=True)
     def disable_selinux(self):
         """Disable SELinux.
 
@@ -402,12 +1098,18 @@ class Context:
             changed1 = self.edit('/etc/selinux/config', replace_line(r'\s*SELINUX\s*=\s*.*', 'SELINUX=disabled'))
         else:
             changed1 = False
-        if self.run('if [ -f /usr/sbin/setenforce ] && [ -f /usr/sbin/getenforce ] ; then echo exists ; fi') == 'exists':
-            changed2 = self.run('STATUS=$(getenforce) ; if [ "$STATUS" == "Enforcing" ] ; then setenforce 0 ; echo perm ; fi').stdout == 'perm'
+        if self.run('if [ -f /usr/sbin/setenforce ] && [ -f /usr/sbin/getenforce ] ; then echo exists ; fi', changes=False) == 'exists':
+            if self.check_mode:
+                changed2 = self.run('getenforce', changes=False).stdout == 'Enforcing'
+                if changed2:
+                    self.name("would setenforce 0")
+            else:
+                changed2 = self.run('STATUS=$(getenforce) ; if [ "$STATUS" == "Enforcing" ] ; then setenforce 0 ; echo perm ; fi', changes=True).stdout == 'perm'
         else:
             changed2 = False
         return changed1 or changed2
 
+    @_operation(changes=True)
     def remove_file(self, remote_filename):
         """Remove remote file.
 
@@ -419,12 +1121,19 @@ class Context:
         """
         if not os.path.isabs(remote_filename):
             raise PossibleRuntimeError(f"Remote filename must be absolute: {remote_filename}")
-        changed = self.run(f'if [ -f {remote_filename} ] ; then rm -f -- {remote_filename} ; echo removed ; fi').stdout == 'removed'
+        if self.check_mode:
+            changed = self._check_mode_files.pop(remote_filename, None) is not None or self.is_file(remote_filename)
+            if changed:
+                self.name(f"would remove {remote_filename}")
+            return changed
+        changed = self.run(f'if [ -f {remote_filename} ] ; then rm -f -- {remote_filename} ; echo removed ; fi', changes=True).stdout == 'removed'
+        self._forget(f"file:{remote_filename}")
         return changed
 
     def mkdir(self, remote_dirname):
         return self.create_directory(remote_dirname)
 
+    @_operation(changes=True)
     def create_directory(self, remote_dirname):
         """Create remote directory.
 
@@ -439,12 +1148,18 @@ class Context:
         """
         if not os.path.isabs(remote_dirname):
             raise PossibleRuntimeError(f"Remote dirname must be absolute: {remote_dirname}")
-        changed = self.run(f'if [ ! -d {remote_dirname} ] ; then mkdir -- {remote_dirname} ; echo created ; fi').stdout == 'created'
+        if self.check_mode:
+            changed = not self.is_directory(remote_dirname)
+            if changed:
+                self.name(f"would create directory {remote_dirname}")
+            return changed
+        changed = self.run(f'if [ ! -d {remote_dirname} ] ; then mkdir -- {remote_dirname} ; echo created ; fi', changes=True).stdout == 'created'
         return changed
 
     def rmdir(self, remote_dirname):
         return self.remove_directory(remote_dirname)
 
+    @_operation(changes=True)
     def remove_directory(self, remote_dirname):
         """Remove remote directory.
 
@@ -459,9 +1174,15 @@ class Context:
         """
         if not os.path.isabs(remote_dirname):
             raise PossibleRuntimeError(f"Remote dirname must be absolute: {remote_dirname}")
-        changed = self.run(f'if [ -d {remote_dirname} ] ; then rmdir -- {remote_dirname} ; echo removed ; fi').stdout == 'removed'
+        if self.check_mode:
+            changed = self.is_directory(remote_dirname)
+            if changed:
+                self.name(f"would remove directory {remote_dirname}")
+            return changed
+        changed = self.run(f'if [ -d {remote_dirname} ] ; then rmdir -- {remote_dirname} ; echo removed ; fi', changes=True).stdout == 'removed'
         return changed
 
+    @_operation(changes=True)
     def systemctl_edit(self, name, override):
         """systemctl edit ``name``.
 
@@ -1,11 +1,19 @@
 
-__all__ = ['task', 'group', 'allow']
+__all__ = ['task', 'group', 'allow', 'handler']
 
 from possible.engine import runtime
 from possible.engine.exceptions import PossibleRuntimeError
 
 
-def task(arg):
+def task(arg=None, *, requires=(), skip_unchanged=False):
+
+    def task_name_of(obj):
+        if callable(obj):
+            return obj.__name__.replace('_', '-')
+        elif isinstance(obj, str):
+            return obj.replace('_', '-')
+        else:
+            raise PossibleRuntimeError(f"Bad required task '{obj}', it must be task name or task function.")
 
     def decorator(func):
         task_name = func.__name__.replace('_', '-')
@@ -13,11 +21,38 @@ def task(arg):
             runtime.tasks[task_name] = func
         else:
             raise PossibleRuntimeError(f"Task '{task_name}' already defined.")
+        if isinstance(requires, str):
+            raise PossibleRuntimeError(f"Task '{task_name}': @task requires must be list of tasks.")
+        runtime.requires[task_name] = [task_name_of(required) for required in requires]
+        if skip_unchanged:
+            runtime.skip_unchanged.add(task_name)
         return func
 
     def decorator_with_arguments(func):
         task_name = func.__name__.replace('_', '-')
-        raise PossibleRuntimeError(f"Task '{task_name}': @task can't have arguments.")
+        raise PossibleRuntimeError(f"Task '{task_name}': @task can't have positional arguments.")
+
+    if callable(arg):
+        return decorator(arg)
+    elif arg is None:
+        return decorator
+    else:
+        return decorator_with_arguments
+
+
+def handler(arg):
+
+    def decorator(func):
+        handler_name = func.__name__.replace('_', '-')
+        if handler_name not in runtime.handlers:
+            runtime.handlers[handler_name] = func
+        else:
+            raise PossibleRuntimeError(f"Handler '{handler_name}' already defined.")
+        return func
+
+    def decorator_with_arguments(func):
+        handler_name = func.__name__.replace('_', '-')
+        raise PossibleRuntimeError(f"Handler '{handler_name}': @handler can't have arguments.")
 
     if callable(arg):
         return decorator(arg)
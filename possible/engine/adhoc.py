@@ -0,0 +1,88 @@
+
+__all__ = ['run_command', 'write_summary']
+
+import concurrent.futures
+import json
+import re
+import sys
+
+from possible.context import Context
+from possible.engine import runtime
+from possible.engine.events import events
+from possible.engine.exceptions import PossibleError
+
+
+ADHOC_CONCURRENCY = 64
+
+MAX_LISTED_HOSTS = 10
+
+
+def _outcome(hostname, command):
+    """Returncode, stdout and stderr of command on host, returncode is None if command failed to run.
+
+    Any error of one host is its outcome, so it never stops command on other hosts.
+    """
+    try:
+        result = Context(hostname).run(command, can_fail=True)
+    except Exception as e:
+        # Host names are hidden in error messages, so same errors of many hosts are grouped.
+        message = str(e) if isinstance(e, PossibleError) else f"{type(e).__name__}: {e}"
+        host = runtime.inventory.hosts[hostname]
+        for name in sorted({hostname, host.host}, key=len, reverse=True):
+            message = re.sub(r'(?<![\w.-])' + re.escape(name) + r'(?![\w.-])', '<host>', message)
+        return (None, '', message)
+    return (result.returncode, result.stdout, result.stderr)
+
+
+def _describe(outcome):
+    returncode, stdout, stderr = outcome
+    if returncode is None:
+        return f"error: {stderr}"
+    lines = list()
+    if returncode != 0:
+        lines.append(f"returncode {returncode}")
+    if stdout:
+        lines.append(stdout)
+    if stderr:
+        lines.append(f"stderr: {stderr}")
+    return '\n'.join(lines) if lines else '(no output)'
+
+
+def _hosts(hostnames):
+    if len(hostnames) <= MAX_LISTED_HOSTS:
+        return ', '.join(hostnames)
+    return f"{', '.join(hostnames[:MAX_LISTED_HOSTS])} and {len(hostnames) - MAX_LISTED_HOSTS} more"
+
+
+def run_command(command, target_hosts, *, concurrency=ADHOC_CONCURRENCY):
+    """Run one command on all target hosts at once, group hosts by identical output.
+
+    Up to ``concurrency`` hosts run command at the same time. Each distinct output is emitted as event
+    of first host, which returned it, as soon as it returned, same outputs of other hosts are only counted.
+
+    Returns:
+        Dict ``{(returncode, stdout, stderr): hostnames}``.
+    """
+    groups = dict()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(concurrency, len(target_hosts) or 1), thread_name_prefix='possible-adhoc') as executor:
+        futures = {executor.submit(_outcome, hostname, command): hostname for hostname in target_hosts}
+        for future in concurrent.futures.as_completed(futures):
+            hostname = futures[future]
+            outcome = future.result()
+            if outcome not in groups:
+                groups[outcome] = list()
+                events.emit(hostname, 'info' if outcome[0] == 0 else 'error', _describe(outcome))
+            groups[outcome].append(hostname)
+    return groups
+
+
+def write_summary(groups, output='human'):
+    """Write each distinct output with number and names of hosts, which returned it, most common output first."""
+    for outcome, hostnames in sorted(groups.items(), key=lambda item: (-len(item[1]), min(item[1]))):
+        hostnames = sorted(hostnames)
+        if output == 'json':
+            returncode, stdout, stderr = outcome
+            sys.stdout.write(json.dumps({'hosts': hostnames, 'returncode': returncode, 'stdout': stdout, 'stderr': stderr}) + '\n')
+        else:
+            sys.stdout.write(f"{len(hostnames)} host{'s' if len(hostnames) != 1 else ''} ({_hosts(hostnames)}): {_describe(outcome)}\n")
+    sys.stdout.flush()
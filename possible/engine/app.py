@@ -1,8 +1,27 @@
 
 __all__ = ['Application']
 
+import collections
+import concurrent.futures
+import hashlib
+import json
+import random
+import time
+
 from possible.engine import runtime
-from possible.engine.exceptions import PossibleUserError
+from possible.engine.adhoc import ADHOC_CONCURRENCY, run_command, write_summary
+from possible.engine.events import events, HumanRenderer, RENDERERS
+from possible.engine.health import health
+from possible.engine.journal import Journal
+from possible.engine.process import CONTROL_PERSIST, timeouts
+from possible.engine.report import report
+from possible.engine.exceptions import PossibleError, PossiblePosfileError, PossibleUserError
+from possible.engine.transport import connect
+
+
+WATCH_JITTER = 0.1
+
+PREWARM_CONCURRENCY = 64
 
 
 class Application:
@@ -13,6 +32,10 @@ class Application:
         self.posfile = posfile
         self.inventory = inventory
         runtime.inventory = inventory
+        events.renderer = HumanRenderer(config.args.quiet)
+        self.journal = Journal(config.journal)
+        runtime.journal = self.journal
+        self._inputs_digest = None
 
     def get_task(self, task_name):
         if task_name not in runtime.tasks:
@@ -52,10 +75,294 @@ class Application:
             if host not in allowed_hosts:
                 raise PossibleUserError(f"Target host '{host}' not allowed for task '{task_name}', permission denied.")
 
+    def check_all_requires(self):
+        for task_name in runtime.tasks:
+            if task_name not in runtime.requires:
+                runtime.requires[task_name] = list()
+            for required in runtime.requires[task_name]:
+                if required not in runtime.tasks:
+                    raise PossiblePosfileError(f"Unknown task '{required}' in requires list of task '{task_name}'.")
+
+    def get_plan(self, task_names):
+        """Requested tasks with all required tasks, each task after tasks it requires."""
+        plan = list()
+
+        def visit(task_name, chain):
+            if task_name in plan:
+                return
+            if task_name in chain:
+                raise PossiblePosfileError(f"Task '{task_name}' requires itself: {' -> '.join(chain + [task_name])}.")
+            for required in runtime.requires[task_name]:
+                visit(required, chain + [task_name])
+            plan.append(task_name)
+
+        for task_name in task_names:
+            visit(task_name, [])
+        return plan
+
+    def get_tasks(self):
+        task_names = self.config.args.task.split(',')
+        for task_name in task_names:
+            self.get_task(task_name)
+        return [(task_name, self.get_task(task_name)) for task_name in self.get_plan(task_names)]
+
+    def inputs_digest(self):
+        """Digest of posfile and all files in files directory."""
+        if self._inputs_digest is None:
+            digest = hashlib.sha256()
+            digest.update(self.posfile.posfile.read_bytes())
+            files = self.config.files
+            if files.is_dir():
+                for path in sorted(files.rglob('*')):
+                    if path.is_file():
+                        digest.update(str(path.relative_to(files)).encode() + b'\0')
+                        digest.update(hashlib.sha256(path.read_bytes()).digest())
+            self._inputs_digest = digest.hexdigest()
+        return self._inputs_digest
+
+    def task_fingerprint(self, task_name, hostname):
+        """Fingerprint of all inputs of task on host: posfile, files, host settings and host vars."""
+        host = self.inventory.hosts[hostname]
+        host_inputs = json.dumps([task_name, host._dict(), host.vars], sort_keys=True, default=str)
+        return hashlib.sha256((self.inputs_digest() + host_inputs).encode()).hexdigest()
+
+    def run_task(self, task_name, task, target_hosts):
+        runtime.current.task = task_name
+        fingerprints = None
+        if task_name in runtime.skip_unchanged and not self.config.args.watch:
+            fingerprints = {hostname: self.task_fingerprint(task_name, hostname) for hostname in target_hosts}
+            unchanged = set(hostname for hostname in target_hosts if self.journal.task_fingerprint(hostname, task_name) == fingerprints[hostname])
+            for hostname in target_hosts:
+                if hostname in unchanged:
+                    events.emit(hostname, 'info', f"skip task {task_name}, inputs unchanged since last successful run")
+            report.task_skipped(task_name, sorted(unchanged))
+            target_hosts = [hostname for hostname in target_hosts if hostname not in unchanged]
+            if not target_hosts:
+                return
+        report.task_started(task_name, target_hosts)
+        started = time.monotonic()
+        runtime.current.contexts.clear()
+        try:
+            task(target_hosts)
+            # Contexts of the same host share notified handlers and systemd changes, they are applied once per host.
+            finished = set()
+            for c in list(runtime.current.contexts):
+                if c.hostname not in finished:
+                    finished.add(c.hostname)
+                    c._task_finished()
+        except BaseException:
+            report.task_failed(task_name, target_hosts)
+            raise
+        finally:
+            report.task_finished(task_name, target_hosts, time.monotonic() - started)
+            runtime.current.contexts.clear()
+            self.journal.flush()
+        if fingerprints is not None and not self.config.args.check:
+            self.journal.task_finished(target_hosts, task_name, fingerprints)
+
+    def run_tasks_parallel(self, tasks, target_hosts):
+        """Run each task on each host as separate job, job starts when all tasks it requires finished on the same host.
+
+        Independent tasks of the same host run at the same time too, cached host state shared by their contexts
+        is locked, notified handlers and systemd changes are kept per task.
+        Failed job does not stop other jobs, only jobs which require it are not started.
+        """
+        waiting = dict()
+        dependents = dict()
+        ready = collections.deque()
+        for task_name, task in tasks:
+            for hostname in target_hosts:
+                job = (task_name, hostname)
+                waiting[job] = len(runtime.requires[task_name])
+                dependents[job] = list()
+                for required in runtime.requires[task_name]:
+                    dependents[(required, hostname)].append(job)
+                if not waiting[job]:
+                    ready.append(job)
+        functions = dict(tasks)
+        not_started = set()
+        errors = list()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.config.args.jobs, thread_name_prefix='possible-task') as executor:
+            running = dict()
+            while ready or running:
+                while ready:
+                    job = ready.popleft()
+                    task_name, hostname = job
+                    running[executor.submit(self.run_task, task_name, functions[task_name], [hostname])] = job
+                finished, dummy_running = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    job = running.pop(future)
+                    if future.exception() is None:
+                        for dependent in dependents[job]:
+                            waiting[dependent] -= 1
+                            if not waiting[dependent] and dependent not in not_started:
+                                ready.append(dependent)
+                    else:
+                        errors.append(future.exception())
+                        stack = list(dependents[job])
+                        while stack:
+                            dependent = stack.pop()
+                            if dependent not in not_started:
+                                not_started.add(dependent)
+                                events.emit(dependent[1], 'warn', f"task {dependent[0]} not started, required task {job[0]} failed")
+                                report.task_skipped(dependent[0], [dependent[1]])
+                                stack.extend(dependents[dependent])
+        if errors:
+            raise errors[0]
+
+    def prewarm(self, target_hosts):
+        """Open ssh master connections to jump hosts and to target hosts behind them in parallel, jump hosts first.
+
+        At most ``max_channels`` masters are opened behind each jump host, as only so many are kept alive.
+        Connection errors are dropped here, unreachable hosts are already marked by health and fail their tasks.
+        """
+        levels = dict()
+        jump_hostnames = set()
+        for hostname in target_hosts:
+            host = self.inventory.hosts[hostname]
+            chain = list()
+            while host.jump_host is not None:
+                host = host.jump_host
+                chain.append(host.name)
+                jump_hostnames.add(host.name)
+            if chain:
+                levels.setdefault(len(chain), set()).add(hostname)
+                for depth, jump_hostname in enumerate(reversed(chain)):
+                    levels.setdefault(depth, set()).add(jump_hostname)
+        if not levels:
+            return
+        with concurrent.futures.ThreadPoolExecutor(max_workers=PREWARM_CONCURRENCY, thread_name_prefix='possible-prewarm') as executor:
+            for depth in sorted(levels):
+                hostnames = list()
+                opened = dict()
+                for hostname in sorted(levels[depth], key=lambda hostname: (hostname not in jump_hostnames, hostname)):
+                    jump_host = self.inventory.hosts[hostname].jump_host
+                    if jump_host is not None:
+                        if opened.get(jump_host.name, 0) >= jump_host.max_channels:
+                            continue
+                        opened[jump_host.name] = opened.get(jump_host.name, 0) + 1
+                    hostnames.append(hostname)
+                list(executor.map(self._prewarm_host, hostnames))
+
+    def _prewarm_host(self, hostname):
+        try:
+            connect(self.inventory.hosts[hostname]).run('true')
+        except PossibleError:
+            pass
+
+    def run_tasks(self, tasks, target_hosts):
+        if self.config.args.jobs is not None and self.config.args.jobs > 1:
+            self.run_tasks_parallel(tasks, target_hosts)
+        else:
+            for task_name, task in tasks:
+                self.run_task(task_name, task, target_hosts)
+
+    def watch(self, tasks, target_hosts):
+        """Check tasks in check mode again and again, emit drift event for each host and task with pending changes.
+
+        Posfile and inventory are loaded once, only per-host caches are cleared before each cycle.
+        Cycles start every ``--watch`` seconds plus random jitter, so many watchers do not hit hosts at once.
+        Run deadline, if any, is counted from start of each cycle. Ssh master connections are kept open
+        between cycles. Nothing is changed on hosts: tasks and handlers only report what they would do.
+        """
+        interval = self.config.args.watch
+        control_persist = max(CONTROL_PERSIST, 2 * interval)
+        while True:
+            started = time.monotonic()
+            runtime.caches.clear()
+            health.clear()
+            timeouts.configure(default=self.config.args.timeout, deadline=self.config.args.deadline, control_persist=control_persist)
+            report.reset()
+            error = None
+            try:
+                self.run_tasks(tasks, target_hosts)
+            except Exception as e:
+                error = e
+            failed = set()
+            for task_name in report.tasks:
+                for hostname, host_task in sorted(report.tasks[task_name].items()):
+                    if host_task.status == 'failed':
+                        failed.add(hostname)
+                        events.emit(hostname, 'fatal', f"task {task_name} check failed")
+                    elif host_task.status == 'changed':
+                        changed = [operation['name'] for operation in host_task.operations if operation['changed']]
+                        events.emit(hostname, 'drift', f"task {task_name} drifted, {len(changed)} changes: {' '.join(changed)}")
+            if error is not None:
+                for hostname in sorted(failed) or target_hosts:
+                    events.emit(hostname, 'fatal', f"check failed: {type(error).__name__}: {error}")
+            if self.config.report:
+                report.write(self.config.report)
+            delay = interval * (1 + random.uniform(0, WATCH_JITTER)) - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+
+    def run_command(self, command):
+        """Run ad-hoc command on all target hosts, print outputs grouped by hosts, return exit code."""
+        if self.config.args.check or self.config.args.watch is not None:
+            raise PossibleUserError("Ad-hoc command can't be run in check or watch mode.")
+        target_hosts = self.get_hosts()
+        if not target_hosts:
+            raise PossibleUserError("Ad-hoc command needs target.")
+        concurrency = self.config.args.jobs if self.config.args.jobs is not None else ADHOC_CONCURRENCY
+        events.start(RENDERERS[self.config.args.output](self.config.args.quiet))
+        if self.config.report:
+            report.enable()
+        try:
+            self.prewarm(target_hosts)
+            groups = run_command(command, target_hosts, concurrency=concurrency)
+        finally:
+            events.close()
+            if self.config.report:
+                report.write(self.config.report)
+        write_summary(groups, self.config.args.output)
+        return 0 if all(returncode == 0 for returncode, dummy_stdout, dummy_stderr in groups) else 1
+
     def run(self):
-        task_name = self.config.args.task
-        task = self.get_task(task_name)
+        if self.config.args.jobs is not None and self.config.args.jobs < 1:
+            raise PossibleUserError(f"Bad number of jobs '{self.config.args.jobs}', it must be positive integer.")
+        if self.config.args.verify_interval < 0:
+            raise PossibleUserError(f"Bad verify interval '{self.config.args.verify_interval}', it can't be negative.")
+        if self.config.args.reconnect_retries < 0 or self.config.args.reconnect_backoff < 0:
+            raise PossibleUserError("Bad reconnect policy, retries and backoff can't be negative.")
+        if self.config.args.retries < 0 or self.config.args.retry_delay < 0 or self.config.args.retry_budget < 0:
+            raise PossibleUserError("Bad retry policy, retries, delay and budget can't be negative.")
+        if self.config.args.timeout <= 0:
+            raise PossibleUserError(f"Bad timeout '{self.config.args.timeout}', it must be positive.")
+        if self.config.args.deadline is not None and self.config.args.deadline <= 0:
+            raise PossibleUserError(f"Bad deadline '{self.config.args.deadline}', it must be positive.")
+        timeouts.configure(default=self.config.args.timeout, deadline=self.config.args.deadline)
+        health.configure(retries=self.config.args.reconnect_retries, backoff=self.config.args.reconnect_backoff,
+                         retries_per_call=self.config.args.retries, retry_delay=self.config.args.retry_delay, retry_budget=self.config.args.retry_budget)
+        if self.config.args.command is not None:
+            return self.run_command(self.config.args.command)
+        if self.config.args.watch is not None:
+            if self.config.args.watch < 1:
+                raise PossibleUserError(f"Bad watch interval '{self.config.args.watch}', it must be positive integer.")
+            self.config.args.check = True
+            self.config.args.incremental = False
+        self.check_all_requires()
+        tasks = self.get_tasks()
         target_hosts = self.get_hosts()
         self.check_all_permissions()
-        self.check_permissions(task_name, target_hosts)
-        task(target_hosts)
+        for task_name, dummy_task in tasks:
+            self.check_permissions(task_name, target_hosts)
+        if any(task_name in runtime.skip_unchanged for task_name, dummy_task in tasks):
+            self.inputs_digest()
+        events.start(RENDERERS[self.config.args.output](self.config.args.quiet))
+        if self.config.report or self.config.args.watch is not None:
+            report.enable()
+        try:
+            self.prewarm(target_hosts)
+            if self.config.args.watch is not None:
+                self.watch(tasks, target_hosts)
+            else:
+                self.run_tasks(tasks, target_hosts)
+        finally:
+            unreachable = health.unreachable()
+            for hostname in sorted(unreachable):
+                events.emit(hostname, 'unreachable', f"host unreachable: {unreachable[hostname]}")
+            report.unreachable = unreachable
+            events.close()
+            self.journal.close()
+            if self.config.report:
+                report.write(self.config.report)
@@ -6,6 +6,7 @@ import sys
 
 from possible.engine.app import Application
 from possible.engine.config import Config
+from possible.engine.events import RENDERERS
 from possible.engine.exceptions import PossibleError, PossiblePosfileError, PossibleInventoryError, PossibleUserError, PossibleRuntimeError
 from possible.engine.inventory import Inventory
 from possible.engine.posfile import Posfile
@@ -13,17 +14,33 @@ from possible.engine.utils import debug, eprint
 from possible import __version__
 
 
-def parse_args():
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(prog='pos', description="possible is configuration management tool")
     parser.add_argument('-v', '--version', action='version', version=__version__, help="show program's version and exit")
     parser.add_argument('-i', '--dump-inventory', dest='dump_inventory', action="store_true", help="show inventory dump and exit")
     parser.add_argument('-r', '--dump-vars', dest='dump_vars', action="store_true", help="show host vars dump and exit")
     parser.add_argument('-d', '--debug', dest='debug', action="store_true", help="run program in debug mode")
     parser.add_argument('-q', '--quiet', dest='quiet', action="store_true", help="run program in quiet mode")
+    parser.add_argument('-n', '--check', dest='check', action="store_true", help="show changes without applying them")
+    parser.add_argument('-c', '--command', dest='command', action="store", metavar="COMMAND", help="run COMMAND on all hosts of TARGET at once, up to 64 hosts or --jobs in parallel, and show outputs grouped by hosts")
+    parser.add_argument('-o', '--output', dest='output', action="store", choices=sorted(RENDERERS), default='human', help="output format")
+    parser.add_argument('--report', dest='report', action="store", metavar="FILE", help="write run report to FILE, JUnit XML if FILE ends with .xml, JSON otherwise")
+    parser.add_argument('-j', '--jobs', dest='jobs', action="store", type=int, default=None, metavar="N", help="run up to N task/host jobs in parallel, ordered only by task requires, independent tasks of the same host run in parallel too (default: 1, for --command: 64)")
+    parser.add_argument('--incremental', dest='incremental', action="store_true", help="skip files which desired state is unchanged since it was last applied, as recorded in local journal")
+    parser.add_argument('--verify-interval', dest='verify_interval', action="store", type=int, default=86400, metavar="SECONDS", help="in incremental mode verify remote state of files last verified more than SECONDS ago (default: 86400)")
+    parser.add_argument('--watch', dest='watch', action="store", type=int, metavar="SECONDS", help="check tasks every SECONDS in check mode and report drift, until interrupted")
+    parser.add_argument('--reconnect-retries', dest='reconnect_retries', action="store", type=int, default=0, metavar="N", help="try unreachable host again up to N times during run (default: 0)")
+    parser.add_argument('--reconnect-backoff', dest='reconnect_backoff', action="store", type=float, default=10, metavar="SECONDS", help="first retry of unreachable host after SECONDS, doubled for each next retry (default: 10)")
+    parser.add_argument('--log-dir', dest='log_dir', action="store", default=None, metavar="DIRECTORY", help="append streamed output of commands of each host to DIRECTORY/HOST.log, of local_run() to DIRECTORY/local.log")
+    parser.add_argument('--timeout', dest='timeout', action="store", type=float, default=600, metavar="SECONDS", help="kill command, if it runs longer than SECONDS, unless host or call sets own timeout (default: 600)")
+    parser.add_argument('--deadline', dest='deadline', action="store", type=float, default=None, metavar="SECONDS", help="kill commands, which are still running SECONDS after start of run")
+    parser.add_argument('--retries', dest='retries', action="store", type=int, default=0, metavar="N", help="retry each ssh call up to N times after failure to connect, before remote command started (default: 0)")
+    parser.add_argument('--retry-delay', dest='retry_delay', action="store", type=float, default=1, metavar="SECONDS", help="base delay of exponential backoff with jitter between retries (default: 1)")
+    parser.add_argument('--retry-budget', dest='retry_budget', action="store", type=int, default=10, metavar="N", help="retry at most N times per host during run (default: 10)")
     parser.add_argument('-e', '--env', dest='env', action="store", help="run in stage/prod/etc env")
-    parser.add_argument('task', nargs='?', action="store", metavar="TASK", help="task to execute")
+    parser.add_argument('task', nargs='?', action="store", metavar="TASK", help="task to execute, or comma separated list of tasks")
     parser.add_argument('target', nargs='?', action="store", metavar="TARGET", help="target for task")
-    return parser.parse_args()
+    return parser.parse_args(argv)
 
 
 def parse_all():
@@ -39,7 +56,11 @@ def parse_all():
     if args.dump_vars:
         print(inventory.dump_vars(), file=sys.stdout, flush=True)
         sys.exit(0)
-    if args.task is None and args.target is None:
+    if args.command is not None:
+        if args.target is not None:
+            raise PossibleUserError("Ad-hoc command needs only target, not task.")
+        args.task, args.target = None, args.task
+    elif args.task is None and args.target is None:
         print(posfile.list_of_tasks(), file=sys.stdout, flush=True)
         sys.exit(0)
     return config, posfile, inventory
@@ -49,8 +70,7 @@ def main():
     try:
         sys.dont_write_bytecode = True
         config, posfile, inventory = parse_all()
-        Application(config, posfile, inventory).run()
-        sys.exit(0)
+        sys.exit(Application(config, posfile, inventory).run() or 0)
     except PossibleRuntimeError as e:
         debug.enable()
         eprint(e)
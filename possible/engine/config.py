@@ -12,7 +12,19 @@ class Config():
             self.env = args.env
         else:
             self.env = None
+        if args.report:
+            self.report = Path(args.report).absolute()
+        else:
+            self.report = None
+        if args.log_dir:
+            self.log_dir = Path(args.log_dir).absolute()
+        else:
+            self.log_dir = None
 
     @property
     def files(self):
         return self.workdir / 'files'
+
+    @property
+    def journal(self):
+        return self.workdir / '.possible' / 'journal.sqlite3'
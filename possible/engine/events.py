@@ -0,0 +1,150 @@
+
+__all__ = ['events', 'Event', 'HumanRenderer', 'JsonRenderer', 'SummaryRenderer', 'RENDERERS']
+
+import json
+import queue
+import sys
+import threading
+import time
+
+from possible.engine import runtime
+
+
+class style:
+    RED = '\033[0;91m'
+    RESET = '\033[0m'
+
+
+class Event:
+    def __init__(self, hostname, status, message):
+        self.time = time.time()
+        self.hostname = hostname
+        self.task = runtime.current.task
+        self.status = status
+        self.message = message
+
+    def _dict(self):
+        return {'time': self.time, 'host': self.hostname, 'task': self.task, 'status': self.status, 'message': self.message}
+
+    def __str__(self):
+        return self._dict().__str__()
+
+    def __repr__(self):
+        return self._dict().__repr__()
+
+
+class HumanRenderer:
+    def __init__(self, quiet=False):
+        self.quiet = quiet
+        self.width = None
+
+    def render(self, event):
+        if self.width is None:
+            self.width = len(max(runtime.hosts, key=len, default=''))
+        line = f"{event.hostname:{self.width}} * {event.message}"
+        if event.status == 'info':
+            if not self.quiet:
+                sys.stdout.write(line + '\n')
+        else:
+            sys.stderr.write(f"{style.RED}{line}{style.RESET}\n")
+
+    def flush(self):
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+    def close(self):
+        self.flush()
+
+
+class JsonRenderer:
+    def __init__(self, quiet=False):
+        self.quiet = quiet
+
+    def render(self, event):
+        sys.stdout.write(json.dumps(event._dict()) + '\n')
+
+    def flush(self):
+        sys.stdout.flush()
+
+    def close(self):
+        self.flush()
+
+
+class SummaryRenderer:
+    def __init__(self, quiet=False):
+        self.quiet = quiet
+        self.counters = dict()
+
+    def render(self, event):
+        if event.hostname not in self.counters:
+            self.counters[event.hostname] = dict()
+        counter = self.counters[event.hostname]
+        counter[event.status] = counter.get(event.status, 0) + 1
+        if event.status != 'info':
+            sys.stderr.write(f"{style.RED}{event.hostname} * {event.message}{style.RESET}\n")
+
+    def flush(self):
+        sys.stderr.flush()
+
+    def close(self):
+        if self.counters:
+            width = len(max(self.counters, key=len))
+            for hostname in sorted(self.counters):
+                counter = self.counters[hostname]
+                statuses = ', '.join(f"{status}={counter[status]}" for status in sorted(counter))
+                sys.stdout.write(f"{hostname:{width}} * {statuses}\n")
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+
+RENDERERS = {'human': HumanRenderer, 'json': JsonRenderer, 'summary': SummaryRenderer}
+
+
+class EventBus:
+    """Per-host event stream.
+
+    Events are queued by worker threads and rendered by one writer thread,
+    so output never blocks workers and lines from different hosts never interleave.
+    Until :meth:`start` is called events are rendered synchronously.
+    """
+    def __init__(self):
+        self.renderer = HumanRenderer()
+        self.queue = None
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self, renderer):
+        self.renderer = renderer
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self._writer, name='possible-events', daemon=True)
+        self.thread.start()
+
+    def _writer(self):
+        while True:
+            event = self.queue.get()
+            if event is None:
+                break
+            self.renderer.render(event)
+            if self.queue.empty():
+                self.renderer.flush()
+
+    def emit(self, hostname, status, *args, sep=' '):
+        event = Event(hostname, status, sep.join(str(arg) for arg in args))
+        if self.thread is not None:
+            self.queue.put(event)
+        else:
+            with self.lock:
+                self.renderer.render(event)
+                self.renderer.flush()
+
+    def close(self):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+            self.queue = None
+        self.renderer.close()
+        self.renderer = HumanRenderer(self.renderer.quiet)
+
+
+events = EventBus()
@@ -21,3 +21,11 @@ class PossibleRuntimeError(PossibleError):
 
 class PossibleFileNotFound(PossibleRuntimeError):
     pass
+
+
+class PossibleHostUnreachable(PossibleRuntimeError):
+    pass
+
+
+class PossibleTimeout(PossibleRuntimeError):
+    pass
@@ -0,0 +1,83 @@
+
+__all__ = ['health']
+
+import threading
+import time
+
+from possible.engine.exceptions import PossibleHostUnreachable
+
+
+class HostHealth:
+    """Per-run connection health of hosts.
+
+    Host is marked unreachable after connection failure, and all operations on it fail immediately,
+    without waiting for ssh connect timeout. Unreachable host is tried again up to ``retries`` times,
+    first time after ``backoff`` seconds, each next time after twice longer delay.
+    Successful connection marks host reachable again.
+
+    Transient connection failures of one call are retried by transport up to ``retries_per_call`` times,
+    with exponential backoff from ``retry_delay`` seconds and full jitter, all retries of one host
+    during run are limited by ``retry_budget``.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.retries = 0
+        self.backoff = 10
+        self.retries_per_call = 0
+        self.retry_delay = 1
+        self.retry_budget = 0
+        self.hosts = dict()
+        self.budgets = dict()
+
+    def configure(self, *, retries, backoff, retries_per_call=0, retry_delay=1, retry_budget=0):
+        self.retries = retries
+        self.backoff = backoff
+        self.retries_per_call = retries_per_call
+        self.retry_delay = retry_delay
+        self.retry_budget = retry_budget
+
+    def take_retry(self, hostname):
+        """Take one retry from budget of host, False if budget is exhausted."""
+        with self.lock:
+            used = self.budgets.get(hostname, 0)
+            if used >= self.retry_budget:
+                return False
+            self.budgets[hostname] = used + 1
+            return True
+
+    def check(self, hostname):
+        if hostname not in self.hosts:
+            return
+        with self.lock:
+            if hostname not in self.hosts:
+                return
+            failures, retry_at, error = self.hosts[hostname]
+            if failures > self.retries or time.monotonic() < retry_at:
+                raise PossibleHostUnreachable(f"Host {hostname} is unreachable: {error}")
+
+    def failed(self, hostname, error):
+        with self.lock:
+            failures = self.hosts[hostname][0] + 1 if hostname in self.hosts else 1
+            self.hosts[hostname] = (failures, time.monotonic() + self.backoff * 2 ** (failures - 1), error)
+
+    def succeeded(self, hostname):
+        if hostname not in self.hosts:
+            return
+        with self.lock:
+            self.hosts.pop(hostname, None)
+
+    def reset(self, hostname):
+        self.succeeded(hostname)
+
+    def clear(self):
+        with self.lock:
+            self.hosts.clear()
+            self.budgets.clear()
+
+    def unreachable(self):
+        """Dict ``{hostname: error}`` of hosts, which are unreachable now."""
+        with self.lock:
+            return {hostname: error for hostname, (dummy_failures, dummy_retry_at, error) in self.hosts.items()}
+
+
+health = HostHealth()
@@ -44,6 +44,45 @@ class HostChecks:
         elif port < 1 or port > 65535:
             raise PossibleInventoryError(f"Bad port number '{port}', it must be between 1 and 65535")
 
+    @staticmethod
+    def ensure_valid_connection(connection):
+        if connection not in CONNECTIONS:
+            raise PossibleInventoryError(f"Bad connection '{connection}', it must be one of: {', '.join(CONNECTIONS)}")
+
+    @staticmethod
+    def ensure_valid_connection_target(connection, container, pid, root):
+        if connection in ('nspawn', 'podman'):
+            if not isinstance(container, str) or not re.fullmatch(r'^[a-zA-Z0-9][a-zA-Z0-9_.-]*$', container):
+                raise PossibleInventoryError(f"Bad container name '{container}', it is required for connection '{connection}'")
+        elif container is not None:
+            raise PossibleInventoryError(f"Bad container name '{container}', it can't be used with connection '{connection}'")
+        if connection == 'nsenter':
+            if not isinstance(pid, int) or isinstance(pid, bool) or pid < 1:
+                raise PossibleInventoryError(f"Bad pid '{pid}', positive integer is required for connection '{connection}'")
+        elif pid is not None:
+            raise PossibleInventoryError(f"Bad pid '{pid}', it can't be used with connection '{connection}'")
+        if connection == 'chroot':
+            if not isinstance(root, str) or not root.startswith('/') or root.rstrip('/') == '':
+                raise PossibleInventoryError(f"Bad root '{root}', absolute directory name is required for connection '{connection}'")
+        elif root is not None:
+            raise PossibleInventoryError(f"Bad root '{root}', it can't be used with connection '{connection}'")
+
+    @staticmethod
+    def ensure_valid_max_channels(max_channels):
+        if not isinstance(max_channels, int) or isinstance(max_channels, bool):
+            raise PossibleInventoryError(f"Bad max channels '{max_channels}', it must be integer")
+        elif max_channels < 1:
+            raise PossibleInventoryError(f"Bad max channels '{max_channels}', it must be positive")
+
+    @staticmethod
+    def ensure_valid_timeout(timeout):
+        if timeout is None:
+            return
+        if not isinstance(timeout, (int, float)) or isinstance(timeout, bool):
+            raise PossibleInventoryError(f"Bad timeout '{timeout}', it must be number")
+        elif timeout <= 0:
+            raise PossibleInventoryError(f"Bad timeout '{timeout}', it must be positive")
+
     @staticmethod
     def ensure_valid_password(password):
         if password is None:
@@ -57,11 +96,21 @@ class HostChecks:
                 raise PossibleInventoryError(f"Bad password '{password}', symbol '{char}' is not allowed")
 
 
+CONNECTIONS = ('ssh', 'local', 'nspawn', 'nsenter', 'podman', 'chroot')
+
+
 class DefaultHost:
+    connection = 'ssh'
     host = None
     port = 22
     user = 'root'
     password = None
+    container = None
+    pid = None
+    root = None
+    jump = None
+    max_channels = 10
+    timeout = None
 
 
 class Host:
@@ -71,7 +120,12 @@ class Host:
         self.vars = dict()
         HostChecks.ensure_valid_host_name(self.name)
         if isinstance(config, dict):
-            self.host = config.pop('host', DefaultHost.host)
+            self.connection = config.pop('connection', DefaultHost.connection)
+            HostChecks.ensure_valid_connection(self.connection)
+            if self.connection != 'ssh':
+                self.host = config.pop('host', 'localhost')
+            else:
+                self.host = config.pop('host', DefaultHost.host)
             HostChecks.ensure_valid_host_name(self.host)
             self.port = config.pop('port', DefaultHost.port)
             HostChecks.ensure_valid_port_number(self.port)
@@ -79,16 +133,27 @@ class Host:
             HostChecks.ensure_valid_user_name(self.user)
             self.password = config.pop('password', DefaultHost.password)
             HostChecks.ensure_valid_password(self.password)
+            self.container = config.pop('container', DefaultHost.container)
+            self.pid = config.pop('pid', DefaultHost.pid)
+            self.root = config.pop('root', DefaultHost.root)
+            HostChecks.ensure_valid_connection_target(self.connection, self.container, self.pid, self.root)
+            self.jump = config.pop('jump', DefaultHost.jump)
+            if self.jump is not None:
+                HostChecks.ensure_valid_host_name(self.jump)
+                if self.connection != 'ssh':
+                    raise PossibleInventoryError(f"Bad jump host '{self.jump}', it can't be used with connection '{self.connection}'")
+            self.jump_host = None
+            self.max_channels = config.pop('max_channels', DefaultHost.max_channels)
+            HostChecks.ensure_valid_max_channels(self.max_channels)
+            self.timeout = config.pop('timeout', DefaultHost.timeout)
+            HostChecks.ensure_valid_timeout(self.timeout)
             if config:
                 raise PossibleInventoryError(f"Bad host {name} configuration: {config}")
         else:
             raise PossibleInventoryError(f"Bad host {name} configuration: {config}")
 
     def _dict(self):
-        temp = copy.deepcopy(self.__dict__)
-        temp.pop('groups')
-        temp.pop('vars')
-        return temp
+        return {key: copy.deepcopy(value) for key, value in self.__dict__.items() if key not in ('groups', 'vars', 'jump_host')}
 
     def __str__(self):
         return self._dict().__str__()
@@ -307,6 +372,7 @@ class Inventory:
             raise PossibleInventoryError(f"Inventory directory '{self.inventory}' not exists")
         self.hosts_filename = self.inventory / 'hosts.yaml'
         self.parse_hosts()
+        self.set_jump_hosts()
         self.groups_filename = self.inventory / 'groups.yaml'
         self.parse_groups()
         self.check_groups()
@@ -341,6 +407,28 @@ class Inventory:
         else:
             raise PossibleInventoryError(f"Hosts file '{self.hosts_filename}' not exists")
 
+    def set_jump_hosts(self):
+        for name in self.hosts:
+            host = self.hosts[name]
+            if host.jump is None:
+                continue
+            if host.jump not in self.hosts:
+                raise PossibleInventoryError(f"Bad host '{name}', jump host '{host.jump}' not found")
+            jump_host = self.hosts[host.jump]
+            if jump_host.connection != 'ssh':
+                raise PossibleInventoryError(f"Bad host '{name}', jump host '{host.jump}' must use ssh connection")
+            if jump_host.password is not None:
+                raise PossibleInventoryError(f"Bad host '{name}', jump host '{host.jump}' must use key authentication, not password")
+            host.jump_host = jump_host
+        for name in self.hosts:
+            seen = [name]
+            host = self.hosts[name]
+            while host.jump_host is not None:
+                host = host.jump_host
+                if host.name in seen:
+                    raise PossibleInventoryError(f"Bad host '{name}', recursive jump hosts: {' -> '.join(seen + [host.name])}")
+                seen.append(host.name)
+
     def parse_groups(self):
         if self.groups_filename.is_file():
             try:
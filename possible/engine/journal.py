@@ -0,0 +1,91 @@
+
+__all__ = ['Journal']
+
+import sqlite3
+import threading
+import time
+
+
+class Journal:
+    """Local state journal, SQLite file in ``.possible`` directory of workdir.
+
+    Keeps fingerprint of inputs of last successful run of each task on each host,
+    and last applied state of each resource on each host: content hash, mode, owner and group.
+    Resource writes are buffered and committed in one transaction by :meth:`flush` at end of task,
+    lookups of resources see buffered writes without committing them.
+    File is created on first write, nothing is stored until journal is needed.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.connection = None
+        self.pending = dict()
+
+    def _connect(self):
+        if self.connection is None:
+            self.filename.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+            self.connection = sqlite3.connect(str(self.filename), check_same_thread=False)
+            self.connection.execute("CREATE TABLE IF NOT EXISTS tasks (host TEXT NOT NULL, task TEXT NOT NULL, fingerprint TEXT NOT NULL, finished REAL NOT NULL, PRIMARY KEY (host, task))")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS resources (host TEXT NOT NULL, resource TEXT NOT NULL, sha256 TEXT NOT NULL, mode TEXT NOT NULL, owner TEXT, grp TEXT, verified REAL NOT NULL, PRIMARY KEY (host, resource))")
+            self.connection.commit()
+        return self.connection
+
+    def task_fingerprint(self, hostname, task_name):
+        """Fingerprint of inputs of last successful run of task on host, or None."""
+        if self.connection is None and not self.filename.exists():
+            return None
+        with self.lock:
+            row = self._connect().execute("SELECT fingerprint FROM tasks WHERE host = ? AND task = ?", (hostname, task_name)).fetchone()
+        return row[0] if row is not None else None
+
+    def task_finished(self, hostnames, task_name, fingerprints):
+        """Record successful run of task on hosts."""
+        finished = time.time()
+        with self.lock:
+            connection = self._connect()
+            with connection:
+                connection.executemany("INSERT OR REPLACE INTO tasks (host, task, fingerprint, finished) VALUES (?, ?, ?, ?)",
+                                       [(hostname, task_name, fingerprints[hostname], finished) for hostname in hostnames])
+
+    def resource(self, hostname, resource):
+        """Last applied state ``(sha256, mode, owner, group)`` of resource on host and time of its last remote verification, or None."""
+        with self.lock:
+            key = (hostname, resource)
+            if key in self.pending:
+                row = self.pending[key]
+                return (tuple(row[:4]), row[4]) if row is not None else None
+            if self.connection is None and not self.filename.exists():
+                return None
+            row = self._connect().execute("SELECT sha256, mode, owner, grp, verified FROM resources WHERE host = ? AND resource = ?", (hostname, resource)).fetchone()
+        return (tuple(row[:4]), row[4]) if row is not None else None
+
+    def resource_applied(self, hostname, resource, state):
+        """Record state ``(sha256, mode, owner, group)`` of resource on host, applied or verified just now."""
+        with self.lock:
+            self.pending[(hostname, resource)] = (*state, time.time())
+
+    def resource_forgotten(self, hostname, resource):
+        """Forget state of resource on host, changed outside of journal."""
+        with self.lock:
+            self.pending[(hostname, resource)] = None
+
+    def flush(self):
+        with self.lock:
+            if not self.pending:
+                return
+            pending, self.pending = self.pending, dict()
+            connection = self._connect()
+            with connection:
+                for (hostname, resource), row in pending.items():
+                    if row is None:
+                        connection.execute("DELETE FROM resources WHERE host = ? AND resource = ?", (hostname, resource))
+                    else:
+                        connection.execute("INSERT OR REPLACE INTO resources (host, resource, sha256, mode, owner, grp, verified) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                           (hostname, resource, *row))
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
@@ -0,0 +1,156 @@
+
+__all__ = ['timeouts', 'start_process', 'communicate']
+
+import os
+import select
+import selectors
+import signal
+import subprocess
+import threading
+import time
+
+from possible.engine.exceptions import PossibleTimeout
+from possible.engine.utils import to_bytes
+
+
+STREAM_CHUNK_SIZE = 65536
+
+MAX_LINE_LENGTH = 65536
+
+CONTROL_PERSIST = 60
+
+
+class Timeouts:
+    """Timeouts of commands run by transports.
+
+    Timeout of each command is taken from ``timeout`` argument of call, from ``timeout`` setting of host
+    in inventory, or from ``--timeout`` command line argument, in this order.
+    No command runs longer than run-wide ``--deadline``, counted from start of run.
+    Idle ssh master connections are kept open for ``control_persist`` seconds.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.default = 600
+        self.deadline = None
+        self.control_persist = CONTROL_PERSIST
+
+    def configure(self, *, default, deadline=None, control_persist=CONTROL_PERSIST):
+        with self.lock:
+            self.default = default
+            self.deadline = time.monotonic() + deadline if deadline is not None else None
+            self.control_persist = control_persist
+
+    def timeout(self, host=None, timeout=None):
+        """Timeout of command in seconds, raise :class:`PossibleTimeout` if run deadline already passed."""
+        if timeout is None and host is not None:
+            timeout = host.timeout
+        if timeout is None:
+            timeout = self.default
+        if self.deadline is not None:
+            remaining = self.deadline - time.monotonic()
+            if remaining <= 0:
+                raise PossibleTimeout("Run deadline exceeded.")
+            timeout = min(timeout, remaining)
+        return timeout
+
+
+timeouts = Timeouts()
+
+
+def start_process(args, *, pass_fds=(), cwd=None):
+    """Start process in new session, so it and all its children can be killed at once."""
+    return subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, pass_fds=pass_fds, cwd=cwd, start_new_session=True)
+
+
+def _kill(p):
+    try:
+        os.killpg(p.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    # Pipes may be held open by daemonized descendants, which left process group, so they are not read anymore.
+    for pipe in (p.stdin, p.stdout, p.stderr):
+        try:
+            pipe.close()
+        except OSError:
+            pass
+    p.wait()
+
+
+def _split_lines(name, buffer, on_line):
+    while True:
+        index = buffer.find(b'\n')
+        if index < 0:
+            break
+        on_line(name, bytes(buffer[:index]))
+        del buffer[:index + 1]
+    while len(buffer) >= MAX_LINE_LENGTH:
+        on_line(name, bytes(buffer[:MAX_LINE_LENGTH]))
+        del buffer[:MAX_LINE_LENGTH]
+
+
+def _stream(p, stdin, timeout, on_line, max_output):
+    deadline = time.monotonic() + timeout
+    outputs = {'stdout': bytearray(), 'stderr': bytearray()}
+    lines = {'stdout': bytearray(), 'stderr': bytearray()}
+    with selectors.DefaultSelector() as selector:
+        if stdin:
+            stdin_view = memoryview(stdin)
+            selector.register(p.stdin, selectors.EVENT_WRITE, 'stdin')
+        else:
+            p.stdin.close()
+        selector.register(p.stdout, selectors.EVENT_READ, 'stdout')
+        selector.register(p.stderr, selectors.EVENT_READ, 'stderr')
+        while selector.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise subprocess.TimeoutExpired(p.args, timeout)
+            for key, dummy_events in selector.select(remaining):
+                name = key.data
+                if name == 'stdin':
+                    try:
+                        written = os.write(key.fd, stdin_view[:select.PIPE_BUF])
+                    except BrokenPipeError:
+                        written = len(stdin_view)
+                    stdin_view = stdin_view[written:]
+                    if not stdin_view:
+                        selector.unregister(key.fileobj)
+                        key.fileobj.close()
+                    continue
+                chunk = os.read(key.fd, STREAM_CHUNK_SIZE)
+                if not chunk:
+                    selector.unregister(key.fileobj)
+                    key.fileobj.close()
+                    if on_line is not None and lines[name]:
+                        on_line(name, bytes(lines[name]))
+                    continue
+                output = outputs[name]
+                output += chunk
+                if max_output is not None and len(output) > max_output:
+                    del output[:len(output) - max_output]
+                if on_line is not None:
+                    lines[name] += chunk
+                    _split_lines(name, lines[name], on_line)
+    p.wait(max(deadline - time.monotonic(), 0))
+    return outputs['stdout'], outputs['stderr']
+
+
+def communicate(p, stdin, timeout, description, *, on_line=None, max_output=None):
+    """Send stdin to process and read its stdout and stderr.
+
+    With ``on_line`` output is read incrementally and ``on_line(name, line)`` is called
+    for each line of ``'stdout'`` and ``'stderr'``, as soon as line is read, without line end.
+    Lines longer than 64 KiB are passed in parts. With ``max_output`` only last ``max_output`` bytes
+    of stdout and stderr are kept and returned, as bytearrays, so memory used by huge output is bounded.
+
+    After ``timeout`` seconds whole process group is killed and :class:`PossibleTimeout` raised.
+    """
+    try:
+        if on_line is None and max_output is None:
+            return p.communicate(to_bytes(stdin), timeout)
+        return _stream(p, to_bytes(stdin), timeout, on_line, max_output)
+    except subprocess.TimeoutExpired:
+        _kill(p)
+        raise PossibleTimeout(f"Command timed out after {timeout:.1f} seconds: {description}") from None
+    except BaseException:
+        _kill(p)
+        raise
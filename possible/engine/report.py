@@ -0,0 +1,177 @@
+
+__all__ = ['report']
+
+import json
+import threading
+import time
+import xml.etree.ElementTree as ElementTree
+
+from possible.engine import runtime
+
+
+class HostTaskReport:
+    """Status of task on host: ``ok``, ``changed``, ``failed``, or ``skipped``, if task did not run on host.
+
+    Duration is wall-clock time of task, operations duration is sum of durations of its operations on host.
+    Round trips count all connection attempts, failed ones too.
+    """
+    def __init__(self):
+        self.status = 'ok'
+        self.duration = 0.0
+        self.operations_duration = 0.0
+        self.round_trips = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.operations = list()
+
+    def _dict(self):
+        return {
+            'status': self.status,
+            'duration': round(self.duration, 6),
+            'operations_duration': round(self.operations_duration, 6),
+            'round_trips': self.round_trips,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'operations': self.operations,
+        }
+
+
+class Report:
+    """Run report: per task and per host status, operation timings and transport counters.
+
+    Collects nothing until enabled by ``--report FILE``.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.started = None
+        self.finished = None
+        self.tasks = dict()
+        self.failed_hosts = dict()
+        self.unreachable = dict()
+
+    def enable(self):
+        self.enabled = True
+        self.started = time.time()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.tasks = dict()
+            self.failed_hosts = dict()
+
+    def _host_task(self, hostname, task_name=None):
+        if task_name is None:
+            task_name = runtime.current.task
+        if task_name not in self.tasks:
+            self.tasks[task_name] = dict()
+        if hostname not in self.tasks[task_name]:
+            self.tasks[task_name][hostname] = HostTaskReport()
+        return self.tasks[task_name][hostname]
+
+    def task_started(self, task_name, hostnames):
+        if not self.enabled:
+            return
+        with self.lock:
+            for hostname in hostnames:
+                self._host_task(hostname, task_name)
+
+    def task_finished(self, task_name, hostnames, duration):
+        if not self.enabled:
+            return
+        with self.lock:
+            for hostname in hostnames:
+                host_task = self._host_task(hostname, task_name)
+                if host_task.status != 'skipped':
+                    host_task.duration = duration
+
+    def task_failed(self, task_name, hostnames):
+        """Mark task failed on host, which operation failed, or on all hosts, if no operation failed.
+
+        Other hosts, on which task did nothing before it was stopped, are marked skipped.
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            hostname = self.failed_hosts.pop((task_name, threading.get_ident()), None)
+            for host_task_hostname in hostnames:
+                host_task = self._host_task(host_task_hostname, task_name)
+                if hostname is None or host_task_hostname == hostname:
+                    host_task.status = 'failed'
+                elif host_task.status == 'ok' and not host_task.operations:
+                    host_task.status = 'skipped'
+
+    def task_skipped(self, task_name, hostnames):
+        if not self.enabled:
+            return
+        with self.lock:
+            for hostname in hostnames:
+                self._host_task(hostname, task_name).status = 'skipped'
+
+    def operation(self, hostname, name, duration, *, changed=False, failed=False, unreachable=False):
+        """Record operation, task on unreachable host is failed, even if task itself handles the error."""
+        if not self.enabled:
+            return
+        with self.lock:
+            host_task = self._host_task(hostname)
+            host_task.operations_duration += duration
+            host_task.operations.append({'name': name, 'duration': round(duration, 6), 'changed': changed, 'failed': failed})
+            if failed:
+                self.failed_hosts[(runtime.current.task, threading.get_ident())] = hostname
+            if unreachable:
+                host_task.status = 'failed'
+            elif changed and host_task.status == 'ok':
+                host_task.status = 'changed'
+
+    def transport(self, hostname, *, sent=0, received=0):
+        if not self.enabled:
+            return
+        with self.lock:
+            host_task = self._host_task(hostname)
+            host_task.round_trips += 1
+            host_task.bytes_sent += sent
+            host_task.bytes_received += received
+
+    def _dict(self):
+        tasks = list()
+        for task_name in self.tasks:
+            hosts = dict()
+            for hostname in sorted(self.tasks[task_name]):
+                hosts[hostname] = self.tasks[task_name][hostname]._dict()
+            tasks.append({'task': task_name, 'hosts': hosts})
+        return {'started': self.started, 'duration': round(self.finished - self.started, 6), 'tasks': tasks, 'unreachable': self.unreachable}
+
+    def _junit(self):
+        testsuites = ElementTree.Element('testsuites', name='possible', time=f"{self.finished - self.started:.6f}")
+        for task_name in self.tasks:
+            hosts = self.tasks[task_name]
+            failures = sum(1 for hostname in hosts if hosts[hostname].status == 'failed')
+            skipped = sum(1 for hostname in hosts if hosts[hostname].status == 'skipped')
+            duration = max((hosts[hostname].duration for hostname in hosts), default=0.0)
+            testsuite = ElementTree.SubElement(testsuites, 'testsuite', name=str(task_name), tests=str(len(hosts)), failures=str(failures),
+                                               skipped=str(skipped), time=f"{duration:.6f}")
+            for hostname in sorted(hosts):
+                host_task = hosts[hostname]
+                testcase = ElementTree.SubElement(testsuite, 'testcase', classname=str(task_name), name=hostname, time=f"{host_task.duration:.6f}")
+                properties = ElementTree.SubElement(testcase, 'properties')
+                for key in ('status', 'operations_duration', 'round_trips', 'bytes_sent', 'bytes_received'):
+                    ElementTree.SubElement(properties, 'property', name=key, value=str(round(getattr(host_task, key), 6)))
+                ElementTree.SubElement(properties, 'property', name='operations', value=str(len(host_task.operations)))
+                if host_task.status == 'failed':
+                    ElementTree.SubElement(testcase, 'failure', message=f"task '{task_name}' failed on host '{hostname}'")
+                elif host_task.status == 'skipped':
+                    ElementTree.SubElement(testcase, 'skipped', message=f"task '{task_name}' not run on host '{hostname}'")
+        return ElementTree.tostring(testsuites, encoding='unicode')
+
+    def write(self, filename):
+        self.finished = time.time()
+        with self.lock:
+            if filename.suffix == '.xml':
+                content = self._junit()
+            else:
+                content = json.dumps(self._dict(), indent=2)
+        with open(filename, 'w') as report_file:
+            report_file.write(content + '\n')
+
+
+report = Report()
@@ -1,3 +1,12 @@
+import threading
+
+
+class Current(threading.local):
+    """Task running in current thread and contexts created by it."""
+    def __init__(self):
+        self.task = None
+        self.contexts = []
+
 
 config = None
 
@@ -5,9 +14,21 @@ inventory = None
 
 hosts = []
 
+current = Current()
+
+journal = None
+
+requires = {}
+
+skip_unchanged = set()
+
+caches = {}
+
 tasks = {}
 
 groups = {}
 
 permissions = {}
 
+handlers = {}
+
@@ -1,26 +1,122 @@
 
-__all__ = ['SSH']
+__all__ = ['SSH', 'Local', 'Chroot', 'Nsenter', 'Nspawn', 'Podman', 'TRANSPORTS', 'connect']
 
+import collections
 import errno
+import hashlib
 import os
 import os.path
+import random
+import re
 import shlex
+import shutil
 import subprocess
-
-from possible.engine.exceptions import PossibleError, PossibleRuntimeError, PossibleFileNotFound
+import tempfile
+import threading
+import time
+
+from possible.engine.exceptions import PossibleError, PossibleRuntimeError, PossibleFileNotFound, PossibleHostUnreachable, PossibleTimeout
+from possible.engine.events import events
+from possible.engine.health import health
+from possible.engine.process import communicate, start_process, timeouts
+from possible.engine.report import report
 from possible.engine.utils import debug, to_bytes, to_text
 
 
-SSH_COMMON_ARGS = (b'-o', b'ControlMaster=auto', b'-o', b'ControlPersist=60s')
+SSH_COMMON_ARGS = (b'-o', b'ControlMaster=auto')
 
 CONTROL_PATH_DIR = '~/.cache/possible'
 
-SSH_COMMAND_TIMEOUT = 600
-
 SSHPASS_AVAILABLE = None
 
+CONTAINER_ENV = ('/usr/bin/env', '-i', 'PATH=/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin', 'HOME=/root', 'LANG=C.UTF-8')
+
+# Errors of ssh client itself, recognized by their prefixes, so output of remote command is never taken for them.
+
+CONNECTION_ERRORS = re.compile(r'^(ssh: connect to host \S+ port \d+: |ssh: Could not resolve hostname |kex_exchange_identification: |ssh_exchange_identification: '
+                               r'|Connection (closed|reset) by \S+ port \d+|Connection timed out during banner exchange|Connection to \S+ closed by remote host'
+                               r'|(client_loop|packet_write_wait|ssh_dispatch_run_fatal): |Timeout, server \S+ not responding'
+                               r'|Host key verification failed|(\S+@\S+: )?Permission denied \(|channel \d+: open failed: |stdio forwarding failed)', re.MULTILINE)
+
+# Failures of connect, banner and key exchange, which surely happened before remote command started,
+# so command can be safely run again. Connection closed or reset later may interrupt running command, it is never retried.
+
+TRANSIENT_CONNECTION_ERRORS = re.compile(r'^(ssh: connect to host \S+ port \d+: (Connection refused|Connection timed out|No route to host|Network is unreachable|Operation timed out)'
+                                         r'|kex_exchange_identification: |ssh_exchange_identification: |Connection timed out during banner exchange)', re.MULTILINE)
+
+RETRY_MAX_DELAY = 30
+
+MASTER_EXIT_TIMEOUT = 10
+
+JUMP_MASTERS = dict()
+
+JUMP_MASTERS_LOCK = threading.Lock()
+
+
+class _JumpMasters:
+    """Live ssh master connections of hosts behind one jump host.
+
+    Master connection of host behind jump host is tunneled through ``-W`` direct-tcpip channel
+    of jump host master connection, and keeps this channel open while master lives, for whole
+    ControlPersist time after last command, not only while command runs. So at most ``max_channels``
+    masters of jump host are kept alive: when all slots are taken, least recently used master
+    without running commands is closed by ``ssh -O exit``, if all masters run commands, caller waits.
+    """
+    def __init__(self, max_channels):
+        self.condition = threading.Condition()
+        self.max_channels = max_channels
+        self.masters = collections.OrderedDict()
+        self.closing = set()
+
+    def acquire(self, transport, timeout):
+        """Take slot of master of transport host, return False if no slot is free in ``timeout`` seconds."""
+        name = transport._host.name
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while True:
+                if name in self.masters:
+                    self.masters.move_to_end(name)
+                    self.masters[name][1] += 1
+                    return True
+                # Master of host, which is being closed, can't be opened again until it is closed.
+                if name not in self.closing:
+                    if len(self.masters) < self.max_channels:
+                        self.masters[name] = [transport, 1]
+                        return True
+                    idle_name = next((idle_name for idle_name, (dummy_transport, users) in self.masters.items() if users == 0), None)
+                    if idle_name is not None:
+                        idle_transport = self.masters.pop(idle_name)[0]
+                        self.masters[name] = [transport, 1]
+                        self.closing.add(idle_name)
+                        break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        # Slot is taken over from idle master, which is closed without lock, so other hosts do not wait for it.
+        try:
+            idle_transport._exit_master()
+        finally:
+            with self.condition:
+                self.closing.discard(idle_name)
+                self.condition.notify_all()
+        return True
+
+    def release(self, transport):
+        with self.condition:
+            self.masters[transport._host.name][1] -= 1
+            self.condition.notify_all()
+
+
+def _jump_masters(jump_host):
+    with JUMP_MASTERS_LOCK:
+        if jump_host.name not in JUMP_MASTERS:
+            JUMP_MASTERS[jump_host.name] = _JumpMasters(jump_host.max_channels)
+        return JUMP_MASTERS[jump_host.name]
+
 
 class SSH:
+
     def __init__(self, host):
         self._host = host
         self.host = self._host.host
@@ -44,10 +140,21 @@ class SSH:
         return SSHPASS_AVAILABLE
 
     @staticmethod
-    def _get_control_path(host, port, user):
+    def _get_control_path(host, port, user, jumps=()):
         pstring = '%s-%s-%s' % (host, port, user)
+        # Same address behind different jump hosts may be different host, so it needs own master connection.
+        if jumps:
+            pstring += '-' + hashlib.sha256(' '.join(jumps).encode()).hexdigest()[:12]
         return os.path.join(os.path.expanduser(CONTROL_PATH_DIR), pstring)
 
+    def _control_path(self):
+        jumps = list()
+        jump_host = self._host.jump_host
+        while jump_host is not None:
+            jumps.append(jump_host.name)
+            jump_host = jump_host.jump_host
+        return SSH._get_control_path(self.host, self.port, self.user, jumps)
+
     def _build_command(self, binary, *other_args):
         '''
         Takes a binary (ssh, scp, sftp) and optional extra arguments and returns
@@ -72,6 +179,7 @@ class SSH:
         b_command += [to_bytes(binary)]
 
         b_command += SSH_COMMON_ARGS
+        b_command += (b'-o', b'ControlPersist=' + to_bytes(timeouts.control_persist) + b's')
 
         if self.port is not None:
             b_command += (b"-o", b"Port=" + to_bytes(self.port))
@@ -89,12 +197,21 @@ class SSH:
         if self.user:
             b_command += (b"-o", b'User="%s"' % to_bytes(self.user))
 
+        # Hosts behind jump host are reached by ssh -W through jump host,
+        # which reuses jump host master connection, so all hosts behind it share one upstream connection,
+        # each live master connection of host behind it holds one direct-tcpip channel of it.
+
+        if self._host.jump_host is not None:
+            jump = SSH(self._host.jump_host)
+            proxy_command = ' '.join(shlex.quote(to_text(arg).replace('%', '%%')) for arg in jump._build_command('ssh'))
+            b_command += (b"-o", b"ProxyCommand=" + to_bytes(f"{proxy_command} -W %h:%p {shlex.quote(jump.host)}"))
+
         cpdir = os.path.expanduser(CONTROL_PATH_DIR)
         os.makedirs(cpdir, mode=0o700, exist_ok=True)
         os.chmod(cpdir, mode=0o700)
         if not os.access(cpdir, os.W_OK):
             raise PossibleError("Cannot write to ControlPath %s" % to_text(cpdir))
-        b_command += (b"-o", b"ControlPath=" + to_bytes(SSH._get_control_path(self.host, self.port, self.user)))
+        b_command += (b"-o", b"ControlPath=" + to_bytes(self._control_path()))
 
         # Finally, we add any caller-supplied extras.
         if other_args:
@@ -102,7 +219,7 @@ class SSH:
 
         return b_command
 
-    def _run(self, cmd, stdin):
+    def _run(self, cmd, stdin, timeout=None, on_line=None, max_output=None):
         '''
         Starts the command and communicates with it until it ends.
         '''
@@ -111,13 +228,64 @@ class SSH:
         # pipelining data, or can't create a pty, we fall back to using plain
         # old pipes.
 
+        health.check(self._host.name)
+        attempt = 0
+        while True:
+            seconds = timeouts.timeout(self._host, timeout)
+            if self._host.jump_host is not None:
+                masters = _jump_masters(self._host.jump_host)
+                if not masters.acquire(self, seconds):
+                    raise PossibleTimeout(f"Host {self._host.name}: no free channel of jump host {self._host.jump_host.name} in {seconds:.1f} seconds")
+                try:
+                    returncode, b_stdout, b_stderr = self._attempt(cmd, stdin, seconds, on_line, max_output)
+                finally:
+                    masters.release(self)
+            else:
+                returncode, b_stdout, b_stderr = self._attempt(cmd, stdin, seconds, on_line, max_output)
+            if returncode != 255:
+                break
+            stderr = b_stderr.decode('utf-8', errors='replace')
+            match = CONNECTION_ERRORS.search(stderr)
+            if not match:
+                break
+            report.transport(self._host.name)
+            error = stderr[match.start():].splitlines()[0].strip()
+            # Password is passed by pipe, which is created once per command, so such commands are not retried.
+            if self.password or not TRANSIENT_CONNECTION_ERRORS.search(stderr) or attempt >= health.retries_per_call or not health.take_retry(self._host.name):
+                health.failed(self._host.name, error)
+                raise PossibleHostUnreachable(f"Host {self._host.name} is unreachable: {error}")
+            delay = random.uniform(0, min(health.retry_delay * 2 ** attempt, RETRY_MAX_DELAY))
+            attempt += 1
+            events.emit(self._host.name, 'warn', f"connection failed, retry {attempt} in {delay:.1f}s: {error}")
+            time.sleep(delay)
+        health.succeeded(self._host.name)
+        return (returncode, b_stdout, b_stderr)
+
+    def _attempt(self, cmd, stdin, timeout, on_line, max_output):
+        ''' run one connection attempt, failed attempts are round trips too, successful one is counted by caller with bytes transferred '''
+        try:
+            return self._run_process(cmd, stdin, timeout, on_line, max_output)
+        except PossibleTimeout:
+            report.transport(self._host.name)
+            raise
+
+    def _exit_master(self):
+        ''' close master connection, if any, so its channel through jump host is closed too '''
+        cmd = [b'ssh', b'-o', b'ControlPath=' + to_bytes(self._control_path()), b'-O', b'exit', to_bytes(self.host)]
+        debug.print(f"SSH command: {cmd}")
+        p = start_process(cmd)
+        try:
+            communicate(p, None, MASTER_EXIT_TIMEOUT, f"host {self._host.name}")
+        except PossibleTimeout:
+            pass
+
+    def _run_process(self, cmd, stdin, timeout, on_line, max_output):
         p = None
 
         if self.password:
-            # pylint: disable=unexpected-keyword-arg
-            p = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, pass_fds=self.sshpass_pipe)
+            p = start_process(cmd, pass_fds=self.sshpass_pipe)
         else:
-            p = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            p = start_process(cmd)
 
         # If we are using SSH password authentication, write the password into
         # the pipe we opened in _build_command.
@@ -132,15 +300,11 @@ class SSH:
                     raise
             os.close(self.sshpass_pipe[1])
 
-        try:
-            b_stdout, b_stderr = p.communicate(to_bytes(stdin), SSH_COMMAND_TIMEOUT)
-        except subprocess.TimeoutExpired:
-            p.kill()
-            b_stdout, b_stderr = p.communicate()
+        b_stdout, b_stderr = communicate(p, stdin, timeout, f"host {self._host.name}", on_line=on_line, max_output=max_output)
 
         return (p.returncode, b_stdout, b_stderr)
 
-    def _file_transport_command(self, in_path, out_path, action):
+    def _file_transport_command(self, in_path, out_path, action, timeout=None):
         if not os.path.isabs(in_path):
             raise PossibleRuntimeError(f"File name must be absolute, not '{in_path}'")
         if not os.path.isabs(out_path):
@@ -153,7 +317,11 @@ class SSH:
         else:
             cmd = self._build_command('scp', in_path, u'{0}:{1}'.format(host, shlex.quote(out_path)))
         debug.print(f"SCP command: {cmd}")
-        (returncode, stdout, stderr) = self._run(cmd, stdin=None)
+        (returncode, stdout, stderr) = self._run(cmd, stdin=None, timeout=timeout)
+        if action == 'get':
+            report.transport(self._host.name, received=os.path.getsize(out_path) if returncode == 0 else 0)
+        else:
+            report.transport(self._host.name, sent=os.path.getsize(in_path))
         if returncode == 0:
             return (returncode, stdout, stderr)
         elif returncode == 255:
@@ -165,24 +333,190 @@ class SSH:
     #
     # Main public methods
     #
-    def run(self, cmd, *, stdin=None):
+    def run(self, cmd, *, stdin=None, timeout=None, on_line=None, max_output=None):
         ''' run a command on the remote host '''
+        sent = len(to_bytes(cmd)) + len(to_bytes(stdin) or b'')
         if not stdin:
             args = ('ssh', '-tt', self.host, cmd)
         else:
             args = ('ssh', self.host, cmd)
         cmd = self._build_command(*args)
         debug.print(f"SSH command: {cmd}")
-        (returncode, stdout, stderr) = self._run(cmd, stdin)
+        (returncode, stdout, stderr) = self._run(cmd, stdin, timeout, on_line, max_output)
+        report.transport(self._host.name, sent=sent, received=len(stdout) + len(stderr))
         debug.print(f"returncode: {returncode}\nstdout: {stdout}\nstderr: {stderr}")
         return (returncode, stdout, stderr)
 
-    def put(self, local_filename, remote_filename):
+    def put(self, local_filename, remote_filename, *, timeout=None):
         ''' transfer a file from local to remote '''
         if not os.path.exists(to_bytes(local_filename)):
             raise PossibleFileNotFound("Local file does not exist: {0}".format(to_text(local_filename)))
-        return self._file_transport_command(local_filename, remote_filename, 'put')
+        return self._file_transport_command(local_filename, remote_filename, 'put', timeout)
 
-    def get(self, remote_filename, local_filename):
+    def get(self, remote_filename, local_filename, *, timeout=None):
         ''' fetch a file from remote to local '''
-        return self._file_transport_command(remote_filename, local_filename, 'get')
+        return self._file_transport_command(remote_filename, local_filename, 'get', timeout)
+
+    def read(self, remote_filename, *, timeout=None):
+        ''' read content of remote file '''
+        fd, temp_filename = tempfile.mkstemp(suffix='.tmp', prefix='possible-', dir='/tmp')
+        os.close(fd)
+        try:
+            self.get(remote_filename, temp_filename, timeout=timeout)
+            with open(temp_filename, 'rb') as temp_file:
+                return temp_file.read()
+        finally:
+            os.remove(temp_filename)
+
+    def write(self, content, remote_filename, *, timeout=None):
+        ''' write content to remote file '''
+        fd, temp_filename = tempfile.mkstemp(suffix='.tmp', prefix='possible-', dir='/tmp')
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                temp_file.write(to_bytes(content))
+            self.put(temp_filename, remote_filename, timeout=timeout)
+        finally:
+            os.remove(temp_filename)
+
+
+class Local:
+    '''
+    Transport for host, on which pos itself runs: commands are run by local bash,
+    files are read and written directly, without ssh, scp and temporary files.
+    '''
+    def __init__(self, host):
+        self._host = host
+
+    def _command(self, cmd):
+        return ['/bin/bash', '-c', cmd]
+
+    def run(self, cmd, *, stdin=None, timeout=None, on_line=None, max_output=None):
+        ''' run a command on the local host '''
+        args = self._command(cmd)
+        debug.print(f"LOCAL command: {args}")
+        seconds = timeouts.timeout(self._host, timeout)
+        p = start_process(args)
+        b_stdout, b_stderr = communicate(p, stdin, seconds, f"host {self._host.name}", on_line=on_line, max_output=max_output)
+        report.transport(self._host.name, sent=len(to_bytes(cmd)) + len(to_bytes(stdin) or b''), received=len(b_stdout) + len(b_stderr))
+        debug.print(f"returncode: {p.returncode}\nstdout: {b_stdout}\nstderr: {b_stderr}")
+        return (p.returncode, b_stdout, b_stderr)
+
+    def put(self, local_filename, remote_filename, *, timeout=None):
+        ''' copy a file '''
+        if not os.path.exists(to_bytes(local_filename)):
+            raise PossibleFileNotFound("Local file does not exist: {0}".format(to_text(local_filename)))
+        shutil.copyfile(local_filename, remote_filename)
+        report.transport(self._host.name, sent=os.path.getsize(local_filename))
+        return (0, b'', b'')
+
+    def get(self, remote_filename, local_filename, *, timeout=None):
+        ''' copy a file '''
+        try:
+            shutil.copyfile(remote_filename, local_filename)
+        except OSError as e:
+            raise PossibleError(f"Failed to copy file {remote_filename} to {local_filename}: {e}")
+        report.transport(self._host.name, received=os.path.getsize(local_filename))
+        return (0, b'', b'')
+
+    def read(self, remote_filename, *, timeout=None):
+        ''' read content of file '''
+        try:
+            with open(remote_filename, 'rb') as remote_file:
+                content = remote_file.read()
+        except OSError as e:
+            raise PossibleError(f"Failed to read file {remote_filename}: {e}")
+        report.transport(self._host.name, received=len(content))
+        return content
+
+    def write(self, content, remote_filename, *, timeout=None):
+        ''' write content to file '''
+        content = to_bytes(content)
+        try:
+            with open(remote_filename, 'wb') as remote_file:
+                remote_file.write(content)
+        except OSError as e:
+            raise PossibleError(f"Failed to write file {remote_filename}: {e}")
+        report.transport(self._host.name, sent=len(content))
+
+
+class _Contained(Local):
+    '''
+    Base of transports for chroot directories and containers on local host: files are read and written
+    by ``cat`` run inside of them by ``_command``, so symbolic links are resolved by kernel
+    as seen from inside and never lead out.
+    '''
+    def put(self, local_filename, remote_filename, *, timeout=None):
+        ''' copy a file '''
+        if not os.path.exists(to_bytes(local_filename)):
+            raise PossibleFileNotFound("Local file does not exist: {0}".format(to_text(local_filename)))
+        with open(local_filename, 'rb') as local_file:
+            self.write(local_file.read(), remote_filename, timeout=timeout)
+        return (0, b'', b'')
+
+    def get(self, remote_filename, local_filename, *, timeout=None):
+        ''' copy a file '''
+        content = self.read(remote_filename, timeout=timeout)
+        try:
+            with open(local_filename, 'wb') as local_file:
+                local_file.write(content)
+        except OSError as e:
+            raise PossibleError(f"Failed to copy file {remote_filename} to {local_filename}: {e}")
+        return (0, b'', b'')
+
+    def read(self, remote_filename, *, timeout=None):
+        ''' read content of file '''
+        if not os.path.isabs(remote_filename):
+            raise PossibleRuntimeError(f"File name must be absolute, not '{remote_filename}'")
+        returncode, stdout, stderr = self.run(f"cat -- {shlex.quote(remote_filename)}", timeout=timeout)
+        if returncode != 0:
+            raise PossibleError(f"Failed to read file {remote_filename}: {to_text(stderr).strip()}")
+        return stdout
+
+    def write(self, content, remote_filename, *, timeout=None):
+        ''' write content to file '''
+        if not os.path.isabs(remote_filename):
+            raise PossibleRuntimeError(f"File name must be absolute, not '{remote_filename}'")
+        returncode, stdout, stderr = self.run(f"cat > {shlex.quote(remote_filename)}", stdin=to_bytes(content), timeout=timeout)
+        if returncode != 0:
+            raise PossibleError(f"Failed to write file {remote_filename}: {to_text(stderr).strip()}")
+
+
+class Chroot(_Contained):
+    '''
+    Transport for chroot directory on local host: commands and file I/O are run by chroot.
+    '''
+    def _command(self, cmd):
+        return ['chroot', self._host.root, *CONTAINER_ENV, '/bin/bash', '-c', cmd]
+
+
+class Nsenter(_Contained):
+    '''
+    Transport for namespaces of process on local host: commands and file I/O are run by nsenter
+    in namespaces and root directory of process.
+    '''
+    def _command(self, cmd):
+        return ['nsenter', f"--target={self._host.pid}", '--mount', '--uts', '--ipc', '--net', '--pid', '--root', '--', *CONTAINER_ENV, '/bin/bash', '-c', cmd]
+
+
+class Nspawn(_Contained):
+    '''
+    Transport for systemd-nspawn container on local host: commands and file I/O are run by ``systemd-run --machine``.
+    '''
+    def _command(self, cmd):
+        return ['systemd-run', f"--machine={self._host.container}", '--quiet', '--wait', '--pipe', '--collect', '--service-type=exec', '/bin/bash', '-c', cmd]
+
+
+class Podman(_Contained):
+    '''
+    Transport for podman container on local host: commands and file I/O are run by ``podman exec``.
+    '''
+    def _command(self, cmd):
+        return ['podman', 'exec', '-i', self._host.container, '/bin/bash', '-c', cmd]
+
+
+TRANSPORTS = {'ssh': SSH, 'local': Local, 'chroot': Chroot, 'nsenter': Nsenter, 'nspawn': Nspawn, 'podman': Podman}
+
+
+def connect(host):
+    ''' transport for inventory host, by its connection setting '''
+    return TRANSPORTS[host.connection](host)
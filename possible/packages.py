@@ -0,0 +1,118 @@
+
+__all__ = ['Packages']
+
+import re
+
+from possible.engine.exceptions import PossibleRuntimeError
+
+
+# Only commands, which change installed packages, invalidate cache, queries like ``rpm -q`` do not.
+
+PACKAGE_COMMANDS = re.compile(r'(?<![\w.-])((yum|dnf)(\s+-\S+)*\s+(install|reinstall|localinstall|remove|erase|autoremove|update|upgrade|downgrade'
+                              r'|distro-sync|swap|shell|group|groupinstall|groupremove|groupupdate|module)\b'
+                              r'|rpm(\s+-\S+)*?\s+(-[iUFe]|--(install|upgrade|freshen|erase|reinstall)\b))')
+
+PACKAGE_NAME = re.compile(r'^[a-zA-Z0-9_.+-]+$')
+
+
+class Packages:
+    """Package manager of remote host.
+
+    List of installed packages is read once per run by one ``rpm -qa`` call and cached.
+    Cache is invalidated after any ``yum`` or ``dnf`` command, which installs, removes or upgrades packages,
+    or ``rpm`` command with ``-i``, ``-U``, ``-F`` or ``-e`` mode run via context.
+    All needed installs and removals are computed locally and applied by one package manager transaction.
+    """
+    def __init__(self, c):
+        self.c = c
+        self._state = c._cache.setdefault('packages', dict())
+
+    def _invalidate(self):
+        with self.c._lock:
+            self._state.pop('installed', None)
+
+    def _load(self):
+        with self.c._lock:
+            if 'installed' not in self._state:
+                stdout = self.c.run("if [ -x /usr/bin/dnf ] ; then echo dnf ; else echo yum ; fi ; rpm -qa --queryformat '%{NAME}\\n'", changes=False).stdout
+                names = stdout.split()
+                self._state['manager'] = names[0]
+                self._state['installed'] = frozenset(names[1:])
+
+    @property
+    def manager(self):
+        """Package manager name, ``dnf`` or ``yum``."""
+        self._load()
+        return self._state['manager']
+
+    @property
+    def installed(self):
+        """Set of names of all installed packages."""
+        self._load()
+        return self._state['installed']
+
+    def is_installed(self, name):
+        """is package installed?
+
+        Args:
+            name: package name
+
+        Returns:
+            True if package installed, False otherwise.
+        """
+        return name in self.installed
+
+    def ensure(self, *, installed=(), removed=()):
+        """Ensure packages installed and removed.
+
+        Only packages which are not in desired state are passed to package manager,
+        install and remove are done in one transaction.
+
+        Args:
+            installed: Names of packages which must be installed.
+            removed: Names of packages which must be removed.
+
+        Returns:
+            True if packages installed or removed, False if all packages already in desired state.
+        """
+        for name in list(installed) + list(removed):
+            if not PACKAGE_NAME.match(name):
+                raise PossibleRuntimeError(f"Invalid package name '{name}'")
+        to_install = sorted(set(installed) - self.installed)
+        to_remove = sorted(set(removed) & self.installed)
+        if not to_install and not to_remove:
+            return False
+        if self.c.check_mode:
+            if to_install:
+                self.c.name(f"would install {' '.join(to_install)}")
+            if to_remove:
+                self.c.name(f"would remove {' '.join(to_remove)}")
+            return True
+        if to_install and to_remove:
+            transaction = f"install {' '.join(to_install)}\nremove {' '.join(to_remove)}\nrun\n"
+            self.c.run(f"{self.manager} shell -y", stdin=transaction, changes=True)
+        elif to_install:
+            self.c.run(f"{self.manager} install -y {' '.join(to_install)}", changes=True)
+        else:
+            self.c.run(f"{self.manager} remove -y {' '.join(to_remove)}", changes=True)
+        if to_install:
+            self.c.name(f"install {' '.join(to_install)}")
+        if to_remove:
+            self.c.name(f"remove {' '.join(to_remove)}")
+        return True
+
+    def install(self, *names):
+        """Install packages, which are not installed yet.
+
+        Returns:
+            True if any package installed, False otherwise.
+        """
+        return self.ensure(installed=names)
+
+    def remove(self, *names):
+        """Remove packages, which are installed.
+
+        Returns:
+            True if any package removed, False otherwise.
+        """
+        return self.ensure(removed=names)
@@ -0,0 +1,163 @@
+
+__all__ = ['Systemd']
+
+import os
+
+from possible.editors import strip
+from possible.engine import runtime
+from possible.engine.exceptions import PossibleRuntimeError
+from possible.engine.utils import to_bytes
+
+
+SYSTEMD_SYSTEM_DIR = '/etc/systemd/system'
+
+UNIT_SUFFIXES = ('.service', '.socket', '.timer', '.mount', '.automount', '.swap', '.target', '.path', '.slice', '.scope')
+
+
+def _unit_name(name):
+    if not isinstance(name, str) or not name or '/' in name or ' ' in name:
+        raise PossibleRuntimeError(f"Invalid unit name '{name}'")
+    if not name.endswith(UNIT_SUFFIXES):
+        name = name + '.service'
+    return name
+
+
+class Systemd:
+    """Systemd units of remote host.
+
+    Unit files, overrides, enable and restart intents are collected during task
+    and applied by :meth:`apply` in one batch: one read of all files, one bulk write,
+    one ``systemctl daemon-reload`` and one ``systemctl restart`` of all units, which files changed.
+    Pending changes are applied automatically at the end of task. Changes are collected per task and host,
+    all contexts of the same host in the same task share them, so they are applied once.
+    """
+    def __init__(self, c):
+        self.c = c
+        self._state = c._cache.setdefault(('systemd', runtime.current.task), dict(files=dict(), units_of_file=dict(), enable=list(), restart=list()))
+
+    def _add_file(self, name, filename, content):
+        files = self._state['files']
+        if filename in files and files[filename] != content:
+            raise PossibleRuntimeError(f"Conflicting content for unit file '{filename}'")
+        files[filename] = content
+        self._state['units_of_file'][filename] = name
+
+    def unit(self, name, content):
+        """Install unit file ``/etc/systemd/system/${name}``.
+
+        Args:
+            name: Unit name, ``.service`` suffix is added if name has no unit type suffix.
+            content: Unit file content.
+        """
+        name = _unit_name(name)
+        self._add_file(name, os.path.join(SYSTEMD_SYSTEM_DIR, name), to_bytes(content))
+
+    def override(self, name, override):
+        """Install ``override.conf`` for unit, like ``systemctl edit name``.
+
+        Args:
+            name: Unit name, ``.service`` suffix is added if name has no unit type suffix.
+            override: Override text, leading and trailing whitespace is stripped.
+                Empty override removes ``override.conf`` file.
+        """
+        name = _unit_name(name)
+        if override is None:
+            override = ''
+        if not isinstance(override, str):
+            raise PossibleRuntimeError("Override must be string type.")
+        override = strip(override)
+        filename = os.path.join(SYSTEMD_SYSTEM_DIR, name + '.d', 'override.conf')
+        self._add_file(name, filename, to_bytes(override) if override else None)
+
+    def enable(self, *names):
+        """Enable units, which are not enabled yet."""
+        for name in names:
+            name = _unit_name(name)
+            if name not in self._state['enable']:
+                self._state['enable'].append(name)
+
+    def restart(self, *names):
+        """Restart units, if any of their unit files or overrides changed."""
+        for name in names:
+            name = _unit_name(name)
+            if name not in self._state['restart']:
+                self._state['restart'].append(name)
+
+    def _pending(self):
+        return bool(self._state['files'] or self._state['enable'] or self._state['restart'])
+
+    def apply(self):
+        """Apply all collected changes.
+
+        Returns:
+            True if any unit file changed or any unit enabled, False otherwise.
+        """
+        state = self._state
+        files, state['files'] = state['files'], dict()
+        units_of_file, state['units_of_file'] = state['units_of_file'], dict()
+        enable, state['enable'] = state['enable'], list()
+        restart, state['restart'] = state['restart'], list()
+        c = self.c
+        changed_units = set()
+        to_write = dict()
+        to_remove = list()
+        directories = dict()
+        if files:
+            dirnames = sorted(set(os.path.dirname(filename) for filename in files))
+            # Unit files are not dereferenced: unit masked by link to /dev/null is left as is,
+            # other links are replaced by regular files, like systemctl edit --full does.
+            remote_files, existing_directories = c._get_many(list(files), directories=dirnames, dereference=False)
+            for filename, content in files.items():
+                info, old_content = remote_files.get(filename, (None, None))
+                if info is not None and info.issym() and info.linkname == '/dev/null':
+                    c.warn(f"{filename} is masked, not changed")
+                    continue
+                if content is None:
+                    if info is not None:
+                        to_remove.append(filename)
+                        changed_units.add(units_of_file[filename])
+                        if c.check_mode:
+                            c.name(f"would remove {filename}")
+                    continue
+                if old_content == content and info.mode & 0o7777 == 0o644:
+                    continue
+                to_write[filename] = (content, '0644', 'root', 'root')
+                changed_units.add(units_of_file[filename])
+                dirname = os.path.dirname(filename)
+                if dirname not in existing_directories:
+                    directories[dirname] = ('0755', 'root', 'root')
+                if c.check_mode:
+                    c._report_change(filename, old_content, content)
+        restart = [name for name in restart if name in changed_units]
+        commands = list()
+        for filename in to_remove:
+            commands.append(f"rm -f -- {filename} ; rmdir --ignore-fail-on-non-empty -- {os.path.dirname(filename)}")
+        if to_write or to_remove:
+            commands.append("systemctl daemon-reload")
+        for name in enable:
+            commands.append(f"if ! systemctl is-enabled -q {name} ; then systemctl enable -q {name} && echo 'enabled {name}' ; fi")
+        if restart:
+            commands.append(f"systemctl restart {' '.join(restart)}")
+        if not commands:
+            return False
+        if c.check_mode:
+            if enable:
+                disabled = c.run(f"for name in {' '.join(enable)} ; do systemctl is-enabled -q $name || echo $name ; done", changes=False).stdout.split()
+                for name in disabled:
+                    c.name(f"would enable {name}")
+                    changed_units.add(name)
+            for name in restart:
+                c.name(f"would restart {name}")
+            return bool(changed_units)
+        script = ' && '.join(f"{{ {command} ; }}" for command in commands)
+        if to_write:
+            result = c._put_many(to_write, directories=directories, command=script, follow_symlinks=False)
+        else:
+            result = c.run(script, changes=True)
+        for line in result.stdout.splitlines():
+            if line.strip().startswith('enabled '):
+                changed_units.add(line.strip()[len('enabled '):])
+                c.name(line.strip())
+        if restart:
+            c.name(f"restart {' '.join(restart)}")
+        return bool(changed_units)